@@ -0,0 +1,61 @@
+"""This python script converts the fake datasets into a columnar (parquet) format.
+Cellsite coords are stored as lng/lat floats, ids as dictionary codes, dates as
+integer days and transactions are partitioned by date.
+OUTPUT: 'data/columnar/{subscribers.parquet, cellsites.parquet, transactions/}'
+"""
+
+# import os
+# os.chdir("../")
+# curr_dir = os.getcwd()
+# print(f"working @: {curr_dir}")
+
+import os
+import hydra
+import shutil
+import pandas as pd
+from hydra.core.hydra_config import HydraConfig
+from omegaconf import DictConfig
+from sds4gdsp.io import write_subscribers, write_cellsites, write_transactions
+from sds4gdsp.sharding import get_part_filepaths, read_csv_parts
+from sds4gdsp.profiler import configure_profiler, span
+
+@hydra.main(version_base=None, config_path="../conf", config_name="config")
+def main(cfg: DictConfig) -> None:
+
+    num_shards = cfg.sharding.num_shards
+    filepath_subscribers = cfg.fake_subscribers.filepath_subscribers
+    filepath_cellsites = cfg.fake_cellsites.filepath_cellsites
+    filepath_transactions = cfg.fake_transactions.filepath_transactions
+    dirpath = cfg.columnar.dirpath
+    chunksize = cfg.columnar.chunksize
+
+    profiler = configure_profiler(
+        enabled=cfg.profiling.enabled,
+        profile_stage=cfg.profiling.profile_stage,
+        dirpath=HydraConfig.get().runtime.output_dir
+    )
+
+    os.makedirs(dirpath, exist_ok=True)
+
+    fake_subscribers = read_csv_parts(filepath_subscribers, num_shards)
+    write_subscribers(fake_subscribers, os.path.join(dirpath, "subscribers.parquet"))
+
+    fake_cellsites = pd.read_csv(filepath_cellsites)
+    write_cellsites(fake_cellsites, os.path.join(dirpath, "cellsites.parquet"))
+
+    # transactions can be bigger than memory, convert chunk by chunk
+    # and start from a clean dataset since parts are appended
+    dirpath_transactions = os.path.join(dirpath, "transactions")
+    shutil.rmtree(dirpath_transactions, ignore_errors=True)
+    part = 0
+    for filepath in get_part_filepaths(filepath_transactions, num_shards):
+        for chunk in pd.read_csv(filepath, chunksize=chunksize):
+            with span("write_parquet", rows=len(chunk)):
+                write_transactions(chunk, dirpath_transactions, part=part)
+            part += 1
+
+    print(f"OK. Successfully saved '{dirpath}'")
+    profiler.save()
+
+if __name__ == "__main__":
+    main()
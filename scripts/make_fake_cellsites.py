@@ -10,17 +10,20 @@ OUTPUT: 'data/fake_cellsites.csv'
 # print(f"working @: {curr_dir}")
 
 import hydra
-import random
 import shapely
-import osmnx as ox
-import pandas as pd
+import numpy as np
 import geopandas as gpd
 import matplotlib.pyplot as plt
-from gadm import GADMDownloader
+from hydra.core.hydra_config import HydraConfig
 from omegaconf import DictConfig
 from functools import reduce
-from shapely.geometry import Point, MultiPolygon
-from sds4gdsp.processor import get_coords_from_graph, dedupe_points
+from shapely.geometry import MultiPolygon
+from sds4gdsp.cache import GeoCache
+from sds4gdsp.geometry import PointArray
+from sds4gdsp.loader import make_boundaries, make_graph_from_polygon
+from sds4gdsp.generator import make_cellsites
+from sds4gdsp.backend import configure_backend
+from sds4gdsp.profiler import configure_profiler, span
 
 @hydra.main(version_base=None, config_path="../conf", config_name="config")
 def main(cfg: DictConfig) -> None:
@@ -29,20 +32,37 @@ def main(cfg: DictConfig) -> None:
     filepath_cellsites = cfg.fake_cellsites.filepath_cellsites
     filepath_cellsites_picture = cfg.fake_cellsites.filepath_cellsites_picture
     gadm_version = cfg.fake_cellsites.gadm_version
-    sample_frac = cfg.fake_cellsites.sample_frac
     min_distance = cfg.fake_cellsites.min_distance
     town_keyword = cfg.fake_cellsites.town_keyword
     ad_level = cfg.fake_cellsites.ad_level
 
-    # for reproducibility
-    random.seed(seed)
+    profiler = configure_profiler(
+        enabled=cfg.profiling.enabled,
+        profile_stage=cfg.profiling.profile_stage,
+        dirpath=HydraConfig.get().runtime.output_dir
+    )
+
+    configure_backend(
+        name=cfg.backend.name,
+        num_workers=cfg.backend.num_workers,
+        chunksize=cfg.backend.chunksize
+    )
+
+    # for reproducibility, cellsites are built once for the
+    # whole town so this dataset is never sharded
+    rng = np.random.default_rng(seed)
+
+    # queries below are slow and need the network, so
+    # they are cached on local disk and reused across runs
+    cache = GeoCache(
+        dirpath=cfg.cache.dirpath,
+        max_bytes=cfg.cache.max_bytes,
+        offline=cfg.cache.offline
+    )
 
     # download gadm PH data
     country_name = "Philippines"
-    downloader = GADMDownloader(version=str(gadm_version))
-    gadm = downloader.get_shape_data_by_country_name(
-        country_name=country_name, ad_level=ad_level
-    )
+    gadm = make_boundaries(country_name, ad_level, gadm_version, cache=cache)
 
     # this should be a non-empty geodataframe
     assert len(gadm) > 0
@@ -67,13 +87,14 @@ def main(cfg: DictConfig) -> None:
     retain_all = False
     truncate_by_edge = True
     clean_periphery = True
-    G = ox.graph_from_polygon(
+    G = make_graph_from_polygon(
         polygon=polygon,
         network_type=network_type,
         simplify=simplify,
         retain_all=retain_all,
         truncate_by_edge=truncate_by_edge,
-        clean_periphery=clean_periphery
+        clean_periphery=clean_periphery,
+        cache=cache
     )
 
     # this should be a non-empty graph
@@ -82,33 +103,24 @@ def main(cfg: DictConfig) -> None:
     # you can visualize the download road network like so
     # ox.plot_graph(G)
 
-    nodes = list(G.nodes)
-    random.shuffle(nodes)
-    coords = get_coords_from_graph(G, nodes)
-    points = list(map(lambda z: Point(z), coords))
-
-    # let's sample a small fraction of the nodes from the town graph
-    sampled_nodes = random.sample(nodes, int(len(nodes)*sample_frac))
-    sampled_coords = get_coords_from_graph(G, sampled_nodes)
-    sampled_points = list(map(lambda z: Point(z), sampled_coords))
-    deduped_points = dedupe_points(points, min_distance)
-
-    # check sampled points vis-a-vis the nodes of original graph
-    fig, ax = plt.subplots(1, 1, figsize=(10, 10))
-    gpd.GeoSeries(points).plot(ax=ax, color="red", alpha=0.4, markersize=50)
-    gpd.GeoSeries(map(lambda s: shapely.wkt.loads(s), deduped_points)).plot(markersize=100, color="blue", alpha=1, ax=ax)
-    ax.plot(*polygon.geoms[0].exterior.xy, linewidth=5, zorder=0)
-    ax.legend(["road intersection", "cellsite", "town boundary"], loc="lower right", facecolor="white", framealpha=1)
-    ax.ticklabel_format(useOffset=False)
-    plt.savefig(filepath_cellsites_picture)
+    # cellsites are the nodes, taken in random order then deduped by distance
+    fake_cellsites = make_cellsites(G, min_distance, rng)
+
+    # check cellsites vis-a-vis the nodes of original graph
+    with span("plot"):
+        fig, ax = plt.subplots(1, 1, figsize=(10, 10))
+        PointArray.from_graph(G).to_geoseries().plot(ax=ax, color="red", alpha=0.4, markersize=50)
+        gpd.GeoSeries(map(lambda s: shapely.wkt.loads(s), fake_cellsites.coords)).plot(markersize=100, color="blue", alpha=1, ax=ax)
+        ax.plot(*polygon.geoms[0].exterior.xy, linewidth=5, zorder=0)
+        ax.legend(["road intersection", "cellsite", "town boundary"], loc="lower right", facecolor="white", framealpha=1)
+        ax.ticklabel_format(useOffset=False)
+        plt.savefig(filepath_cellsites_picture)
 
     # save file to local disk
-    fake_cellsites = pd.DataFrame(dict(
-        cel_uid=[f"glo-cel-{str(i+1).zfill(3)}" for i in range(len(deduped_points))],
-        coords=deduped_points
-    ))
-    fake_cellsites.to_csv(filepath_cellsites, index=False)
+    with span("write_csv", rows=len(fake_cellsites)):
+        fake_cellsites.to_csv(filepath_cellsites, index=False)
     print(f"OK. Successfully saved '{filepath_cellsites}'")
+    profiler.save()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,5 @@
 """This python script creates a fake telco subscriber dataset.
-OUTPUT: 'data/fake_subscribers.csv'
+OUTPUT: 'data/fake_subscribers.csv', or 'data/fake_subscribers-part-XXXXX.csv' per shard
 """
 
 # import os
@@ -8,49 +8,47 @@ OUTPUT: 'data/fake_subscribers.csv'
 # print(f"working @: {curr_dir}")
 
 import hydra
-import random
-import pandas as pd
+from functools import partial
+from hydra.core.hydra_config import HydraConfig
 from omegaconf import DictConfig
-from faker import Faker
+from sds4gdsp.generator import make_subscribers
+from sds4gdsp.sharding import get_shard_bounds, get_shard_rng, write_shard, run_shards
+from sds4gdsp.profiler import configure_profiler, span
 
 @hydra.main(version_base=None, config_path="../conf", config_name="config")
 def main(cfg: DictConfig) -> None:
 
     seed = cfg.seed
+    num_shards = cfg.sharding.num_shards
+    num_workers = cfg.sharding.num_workers
     filepath_subscribers = cfg.fake_subscribers.filepath_subscribers
     num_subs = cfg.fake_subscribers.num_subs
     min_age = cfg.fake_subscribers.min_age
     max_age = cfg.fake_subscribers.max_age
-
-    # initialize faker module
-    fake = Faker()
-
-    # for reproducibility
-    random.seed(seed)
-
-    fake_subscribers = pd.DataFrame()
-
-    for i in range(num_subs):
-        sub_uid = f"glo-sub-{str(i+1).zfill(3)}"
-        gender = random.choice(["male", "female"])
-        name = fake.name_male() if gender=="male" else fake.name_female()
-        age = random.randint(min_age, max_age)
-        chi_indicator = random.choice([0, 1])
-        ewallet_user_indicator = random.choice(["Y", "N"])
-        data = pd.DataFrame(
-            dict(
-                sub_uid=sub_uid,
-                gender=gender,
-                age=age,
-                name=name,
-                chi_indicator=chi_indicator,
-                ewallet_user_indicator=ewallet_user_indicator
-            ), index=[0]
-        )
-        fake_subscribers = pd.concat([fake_subscribers, data], ignore_index=True)
-
-    fake_subscribers.to_csv(filepath_subscribers, index=False)
-    print(f"OK. Successfully saved '{filepath_subscribers}'")
+    batch_size = cfg.fake_subscribers.batch_size
+    name_pool_size = cfg.fake_subscribers.name_pool_size
+
+    profiler = configure_profiler(
+        enabled=cfg.profiling.enabled,
+        profile_stage=cfg.profiling.profile_stage,
+        dirpath=HydraConfig.get().runtime.output_dir
+    )
+
+    # one task per range of subs, each with its own random
+    # stream (for reproducibility) and its own part-file
+    tasks = []
+    for shard_id, (start, stop) in enumerate(get_shard_bounds(num_subs, num_shards)):
+        tasks.append(partial(
+            write_shard, make_subscribers, filepath_subscribers, shard_id, num_shards,
+            start=start, stop=stop, min_age=min_age, max_age=max_age,
+            rng=get_shard_rng(seed, shard_id, "subscribers"),
+            batch_size=batch_size,
+            name_pool_size=name_pool_size
+        ))
+    with span("subscribers", rows=num_subs):
+        run_shards(tasks, num_workers)
+    print(f"OK. Successfully saved '{filepath_subscribers}' ({num_shards} shard/s)")
+    profiler.save()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
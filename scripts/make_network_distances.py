@@ -0,0 +1,70 @@
+"""This python script precomputes the road network distances between the fake cellsites.
+Run this after 'make_fake_cellsites', the town graph is then read from the local cache.
+OUTPUT: 'data/network_distances.npz'
+"""
+
+# import os
+# os.chdir("../")
+# curr_dir = os.getcwd()
+# print(f"working @: {curr_dir}")
+
+import hydra
+import pandas as pd
+from hydra.core.hydra_config import HydraConfig
+from omegaconf import DictConfig
+from sds4gdsp.cache import GeoCache
+from sds4gdsp.loader import make_boundaries, make_graph_from_polygon
+from sds4gdsp.network import NetworkDistanceTable
+from sds4gdsp.processor import get_cellsite_lnglat
+from sds4gdsp.profiler import configure_profiler, span
+
+@hydra.main(version_base=None, config_path="../conf", config_name="config")
+def main(cfg: DictConfig) -> None:
+
+    filepath_cellsites = cfg.fake_cellsites.filepath_cellsites
+    gadm_version = cfg.fake_cellsites.gadm_version
+    town_keyword = cfg.fake_cellsites.town_keyword
+    ad_level = cfg.fake_cellsites.ad_level
+    filepath_network_distances = cfg.network_distances.filepath_network_distances
+    top_k = cfg.network_distances.top_k
+    max_dense_cels = cfg.network_distances.max_dense_cels
+    with_routes = cfg.network_distances.with_routes
+
+    profiler = configure_profiler(
+        enabled=cfg.profiling.enabled,
+        profile_stage=cfg.profiling.profile_stage,
+        dirpath=HydraConfig.get().runtime.output_dir
+    )
+
+    cache = GeoCache(
+        dirpath=cfg.cache.dirpath,
+        max_bytes=cfg.cache.max_bytes,
+        offline=cfg.cache.offline
+    )
+
+    # same town boundary and road network as the cellsites
+    gadm = make_boundaries("Philippines", ad_level, gadm_version, cache=cache)
+    polygon = gadm.loc[gadm.NAME_2==town_keyword].geometry.item()
+    G = make_graph_from_polygon(
+        polygon=polygon,
+        network_type="drive",
+        simplify=True,
+        retain_all=False,
+        truncate_by_edge=True,
+        clean_periphery=True,
+        cache=cache
+    )
+
+    # snap cellsites to the graph then run the batched shortest paths
+    fake_cellsites = pd.read_csv(filepath_cellsites)
+    lng, lat = get_cellsite_lnglat(fake_cellsites)
+    with span("network_distances", rows=len(fake_cellsites)):
+        table = NetworkDistanceTable.build(
+            G, lng, lat, top_k=top_k, max_dense_cels=max_dense_cels, with_routes=with_routes
+        )
+    table.save(filepath_network_distances)
+    print(f"OK. Successfully saved '{filepath_network_distances}'")
+    profiler.save()
+
+if __name__ == "__main__":
+    main()
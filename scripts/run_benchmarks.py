@@ -0,0 +1,47 @@
+"""This python script times the hot paths of the processor, loader and generator at
+increasing scales, and flags regressions against a previous run when given one.
+OUTPUT: 'benchmarks/results.json'
+"""
+
+# import os
+# os.chdir("../")
+# curr_dir = os.getcwd()
+# print(f"working @: {curr_dir}")
+
+import hydra
+from omegaconf import DictConfig, OmegaConf
+from sds4gdsp.benchmark import run_benchmarks, find_regressions, save_results, load_results
+
+@hydra.main(version_base=None, config_path="../conf", config_name="config")
+def main(cfg: DictConfig) -> None:
+
+    seed = cfg.seed
+    filepath_results = cfg.benchmarks.filepath_results
+    filepath_baseline = cfg.benchmarks.filepath_baseline
+    scales = cfg.benchmarks.scales
+    cases = cfg.benchmarks.cases
+    max_scales = OmegaConf.to_container(cfg.benchmarks.max_scales)
+    repeat = cfg.benchmarks.repeat
+    tolerance = cfg.benchmarks.tolerance
+    min_seconds = cfg.benchmarks.min_seconds
+
+    results = run_benchmarks(
+        scales=list(scales),
+        cases=list(cases) if cases else None,
+        max_scales=max_scales,
+        repeat=repeat,
+        seed=seed
+    )
+
+    # compare against a previous run, e.g. a copy of the results from main
+    if filepath_baseline:
+        regressions = find_regressions(results, load_results(filepath_baseline), tolerance, min_seconds)
+        results["regressions"] = regressions
+        for r in regressions:
+            print(f"REGRESSION {r['case']} n={r['scale']} {r['metric']}: {r['baseline']:.4f} -> {r['current']:.4f} ({r['ratio']:.2f}x)")
+
+    save_results(results, filepath_results)
+    print(f"OK. Successfully saved '{filepath_results}'")
+
+if __name__ == "__main__":
+    main()
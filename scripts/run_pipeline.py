@@ -0,0 +1,47 @@
+"""This python script creates the fake telco datasets as a pipeline of stages
+(boundary, graph, cellsites, knn, subscribers, transactions), only rerunning the
+stages whose config (or upstream stages) changed since their artifacts were made.
+e.g. `python -m scripts.run_pipeline --multirun fake_transactions.k_nearest_neighbor=3,5`
+only reruns 'knn' and 'transactions' per value.
+OUTPUT: 'data/pipeline/{stage}-{key}/', copied to the dataset filepaths with `pipeline.publish`
+"""
+
+# import os
+# os.chdir("../")
+# curr_dir = os.getcwd()
+# print(f"working @: {curr_dir}")
+
+import hydra
+from hydra.core.hydra_config import HydraConfig
+from omegaconf import DictConfig
+from sds4gdsp.pipeline import make_pipeline, publish
+from sds4gdsp.backend import configure_backend
+from sds4gdsp.profiler import configure_profiler
+
+@hydra.main(version_base=None, config_path="../conf", config_name="config")
+def main(cfg: DictConfig) -> None:
+
+    dirpath = cfg.pipeline.dirpath
+    targets = cfg.pipeline.targets
+    force = cfg.pipeline.force
+
+    profiler = configure_profiler(
+        enabled=cfg.profiling.enabled,
+        profile_stage=cfg.profiling.profile_stage,
+        dirpath=HydraConfig.get().runtime.output_dir
+    )
+
+    configure_backend(
+        name=cfg.backend.name,
+        num_workers=cfg.backend.num_workers,
+        chunksize=cfg.backend.chunksize
+    )
+
+    pipeline = make_pipeline(dirpath)
+    dirpaths = pipeline.run(cfg, targets=list(targets) if targets else None, force=list(force or []))
+    if cfg.pipeline.publish:
+        publish(cfg, dirpaths)
+    profiler.save()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+from typing import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+BACKENDS = ("serial", "thread", "process")
+
+class ExecutionBackend:
+    """How WKT point parsing runs: serially, in a thread pool or in a process pool.
+
+    Items are split into chunks of `chunksize` and `func` runs once per chunk, so a
+    process pool pays for pickling once per chunk rather than once per row. Pools
+    only live for the duration of a call, and inputs that fit in a single chunk run
+    in the calling thread, so short runs never start (or leave behind) idle workers.
+    """
+
+    def __init__(self, name: str = "serial", num_workers: int = None, chunksize: int = 100_000):
+        if name not in BACKENDS:
+            raise ValueError(f"unknown backend '{name}', expected one of {BACKENDS}")
+        self.name = name
+        self.num_workers = num_workers
+        self.chunksize = chunksize
+
+    def split(self, items: Sequence) -> list:
+        return [items[start:start+self.chunksize] for start in range(0, len(items), self.chunksize)]
+
+    def map_chunks(self, func: Callable, items: Sequence) -> list:
+        """Run `func` on each chunk of `items`, returns the results in chunk order.
+        `func` must be picklable (a module level function) for the process backend.
+        """
+        chunks = self.split(items)
+        if self.name == "serial" or len(chunks) <= 1:
+            return [func(chunk) for chunk in chunks]
+        executor_class = ThreadPoolExecutor if self.name == "thread" else ProcessPoolExecutor
+        num_workers = min(self.num_workers or len(chunks), len(chunks))
+        with executor_class(max_workers=num_workers) as executor:
+            return list(executor.map(func, chunks))
+
+_backend = ExecutionBackend()
+
+def get_backend() -> ExecutionBackend:
+    return _backend
+
+def configure_backend(name: str = "serial", num_workers: int = None, chunksize: int = 100_000) -> ExecutionBackend:
+    """Replace the process-wide backend, serial by default."""
+    global _backend
+    _backend = ExecutionBackend(name, num_workers, chunksize)
+    return _backend
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from sds4gdsp.loader import make_points, make_spatial_data
+from sds4gdsp.processor import (
+    calc_haversine_distance, calc_haversine_distances, dedupe_points,
+    calc_total_travel_distance, fetch_total_travel_distance
+)
+from sds4gdsp.generator import format_uids, simulate_transactions
+from sds4gdsp.distances import CellDistanceCache
+
+# bounding box of the town used for the fake datasets (lng_min, lng_max, lat_min, lat_max)
+TOWN_BOUNDS = (121.03, 121.10, 14.46, 14.56)
+
+def measure_time(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def measure_peak_memory(func) -> float:
+    """Trace the peak memory (in MB) allocated by a call, numpy buffers included.
+    Tracing slows down python level code, so this runs apart from the timings.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20
+
+def make_wkt_points(n: int, bounds=TOWN_BOUNDS):
+    return [f"POINT ({lng} {lat})" for lng, lat in make_points(n, *bounds)]
+
+def make_traj(n: int, bounds=TOWN_BOUNDS) -> pd.DataFrame:
+    """Make a single trajectory of n transactions, in the format of `get_sub_traj`."""
+    hrs = np.arange(n) % 24
+    return pd.DataFrame(dict(
+        cel_uid=format_uids("glo-cel-", 0, n),
+        transaction_dt=np.repeat(pd.date_range("2023-06-01", periods=n // 24 + 1).strftime("%Y-%m-%d"), 24)[:n],
+        transaction_hr=hrs,
+        coords=make_wkt_points(n, bounds)
+    ))
+
+def make_benchmark_transactions(n: int, num_cels: int = 500, seed: int = 2023) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(dict(
+        txn_uid=format_uids("glo-txn-", 0, n, width=5),
+        sub_uid=format_uids("glo-sub-", 0, max(n // 300, 1))[rng.integers(max(n // 300, 1), size=n)],
+        cel_uid=format_uids("glo-cel-", 0, num_cels)[rng.integers(num_cels, size=n)],
+        transaction_dt="2023-06-01",
+        transaction_hr=rng.integers(24, size=n)
+    ))
+
+def setup_haversine_scalar(n: int, seed: int, dirpath: str):
+    p1, p2 = make_wkt_points(n), make_wkt_points(n)
+    return lambda: [calc_haversine_distance(a, b) for a, b in zip(p1, p2)]
+
+def setup_haversine_vectorized(n: int, seed: int, dirpath: str):
+    coords = np.array(make_points(2 * n, *TOWN_BOUNDS))
+    lng1, lat1, lng2, lat2 = coords[:n, 0], coords[:n, 1], coords[n:, 0], coords[n:, 1]
+    return lambda: calc_haversine_distances(lng1, lat1, lng2, lat2)
+
+def setup_dedupe_points(n: int, seed: int, dirpath: str):
+    points, _, _ = make_spatial_data(n)
+    return lambda: dedupe_points(points, 300)
+
+def setup_calc_total_travel_distance(n: int, seed: int, dirpath: str):
+    traj = make_traj(n)
+    return lambda: calc_total_travel_distance(traj)
+
+def setup_fetch_total_travel_distance(n: int, seed: int, dirpath: str):
+    traj = make_traj(n)
+    return lambda: fetch_total_travel_distance(traj)
+
+def setup_calc_total_travel_distance_cached(n: int, seed: int, dirpath: str):
+    # a trajectory over the few hundred sites of a town, distances read from the cache
+    num_cels = 500
+    rng = np.random.default_rng(seed)
+    cellsites = pd.DataFrame(dict(cel_uid=format_uids("glo-cel-", 0, num_cels), coords=make_wkt_points(num_cels)))
+    distance_cache = CellDistanceCache.from_cellsites(cellsites)
+    traj = pd.DataFrame(dict(cel_uid=cellsites.cel_uid.to_numpy()[rng.integers(num_cels, size=n)]))
+    return lambda: calc_total_travel_distance(traj, distance_cache)
+
+def setup_simulate_transactions(n: int, seed: int, dirpath: str):
+    # a sub makes about 11 transactions a day with the default stay proba and start hour
+    num_subs, num_cels, k = max(n // 11, 1), 500, 3
+    rng = np.random.default_rng(seed)
+    sub_uids = format_uids("glo-sub-", 0, num_subs)
+    cel_uids = format_uids("glo-cel-", 0, num_cels)
+    neighbors = rng.integers(num_cels, size=(num_cels, k))
+    stay_probas = np.full(num_subs, 0.5)
+    # a fresh generator per run, so that every repeat simulates the same data
+    return lambda: sum(len(chunk) for chunk in simulate_transactions(
+        sub_uids, stay_probas, cel_uids, neighbors, "2023-06-01", 1, 7, np.random.default_rng(seed)
+    ))
+
+def setup_read_csv(n: int, seed: int, dirpath: str):
+    filepath = os.path.join(dirpath, "transactions.csv")
+    make_benchmark_transactions(n, seed=seed).to_csv(filepath, index=False)
+    return lambda: pd.read_csv(filepath)
+
+CASES = dict(
+    calc_haversine_distance=setup_haversine_scalar,
+    calc_haversine_distances=setup_haversine_vectorized,
+    dedupe_points=setup_dedupe_points,
+    calc_total_travel_distance=setup_calc_total_travel_distance,
+    calc_total_travel_distance_cached=setup_calc_total_travel_distance_cached,
+    fetch_total_travel_distance=setup_fetch_total_travel_distance,
+    simulate_transactions=setup_simulate_transactions,
+    read_csv=setup_read_csv
+)
+
+def run_benchmarks(scales, cases=None, max_scales=None, repeat=3, seed=2023) -> dict:
+    """Run every case at every scale (capped per case by `max_scales`), keeping the fastest of
+    `repeat` runs and the peak memory of an extra traced run. Each case runs once untimed
+    first, so lazy imports and first call setup are not counted in the smallest scale.
+    """
+    cases = cases or list(CASES)
+    max_scales = max_scales or {}
+    results = []
+    for case in cases:
+        for n in scales:
+            n = int(n)
+            if n > max_scales.get(case, float("inf")):
+                continue
+            random.seed(seed)
+            np.random.seed(seed)
+            with tempfile.TemporaryDirectory(prefix="sds4gdsp-bench-") as dirpath:
+                func = CASES[case](n, seed, dirpath)
+                func() # warm up
+                seconds = min(measure_time(func) for _ in range(repeat))
+                peak_mb = measure_peak_memory(func)
+            results.append(dict(
+                case=case, scale=n, seconds=seconds, peak_mb=peak_mb,
+                rows_per_sec=n / seconds if seconds > 0 else None
+            ))
+            print(f"{case:>30} n={n:<10} {seconds:.4f}s {peak_mb:.1f}MB")
+    meta = dict(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        python=sys.version.split()[0],
+        numpy=np.__version__,
+        pandas=pd.__version__,
+        platform=platform.platform(),
+        seed=seed,
+        repeat=repeat
+    )
+    return dict(meta=meta, results=results)
+
+def find_regressions(results: dict, baseline: dict, tolerance: float = 0.2, min_seconds: float = 0.01) -> list:
+    """Flag the (case, scale) pairs that got slower, or used more memory, by more than `tolerance`.
+    Timings are only flagged when they also grew by more than `min_seconds`, below that
+    the ratio is mostly timer noise.
+    """
+    previous = {(r["case"], r["scale"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        b = previous.get((r["case"], r["scale"]))
+        if b is None:
+            continue
+        for metric in ["seconds", "peak_mb"]:
+            if metric == "seconds" and r[metric] - b[metric] <= min_seconds:
+                continue
+            if b[metric] > 0 and r[metric] > b[metric] * (1 + tolerance):
+                regressions.append(dict(
+                    case=r["case"], scale=r["scale"], metric=metric,
+                    baseline=b[metric], current=r[metric], ratio=r[metric] / b[metric]
+                ))
+    return regressions
+
+def save_results(results: dict, filepath: str) -> None:
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w") as f:
+        json.dump(results, f, indent=2)
+
+def load_results(filepath: str) -> dict:
+    with open(filepath) as f:
+        return json.load(f)
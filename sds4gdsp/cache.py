@@ -0,0 +1,94 @@
+import os
+import gzip
+import json
+import pickle
+import hashlib
+from typing import Callable
+
+class GeoCache:
+    """Content-addressed on-disk cache for slow (network bound) queries like OSM graphs
+    and GADM boundaries. Entries are keyed on the query parameters, stored as gzipped
+    pickles and evicted least recently used first once `max_bytes` is exceeded.
+    With `offline`, a cache miss raises instead of querying the network.
+    """
+
+    def __init__(self, dirpath: str, max_bytes: int = 2 * 2**30, offline: bool = False):
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(dirpath, exist_ok=True)
+
+    @staticmethod
+    def make_key(kind: str, params: dict) -> str:
+        """Hash the kind of query and its parameters, geometries are hashed by their WKB."""
+        def encode(obj):
+            if hasattr(obj, "wkb_hex"):
+                return obj.wkb_hex
+            if hasattr(obj, "tolist"):
+                return obj.tolist()
+            raise TypeError(f"cannot hash cache parameter of type {type(obj).__name__}")
+        payload = json.dumps(dict(kind=kind, params=params), sort_keys=True, default=encode)
+        return f"{kind}-{hashlib.sha256(payload.encode()).hexdigest()[:32]}"
+
+    def get_filepath(self, key: str) -> str:
+        return os.path.join(self.dirpath, f"{key}.pkl.gz")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self.get_filepath(key))
+
+    def get(self, key: str):
+        filepath = self.get_filepath(key)
+        with gzip.open(filepath, "rb") as f:
+            value = pickle.load(f)
+        # mark as recently used for the eviction order
+        os.utime(filepath)
+        return value
+
+    def put(self, key: str, value) -> None:
+        filepath = self.get_filepath(key)
+        # write then rename so a crash never leaves a partial entry behind
+        tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+        with gzip.open(tmp_filepath, "wb", compresslevel=6) as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+        self.evict()
+
+    def get_or_create(self, kind: str, params: dict, factory: Callable):
+        """Fetch the cached result of a query, or run `factory()` and cache it."""
+        key = self.make_key(kind, params)
+        if key in self:
+            return self.get(key)
+        if self.offline:
+            raise FileNotFoundError(f"'{kind}' query is not cached in '{self.dirpath}' and cache is offline")
+        value = factory()
+        self.put(key, value)
+        return value
+
+    def list_entries(self):
+        """List (filepath, num_bytes, last_used) of the entries, least recently used first."""
+        entries = []
+        for f in os.listdir(self.dirpath):
+            if f.endswith(".pkl.gz"):
+                stat = os.stat(os.path.join(self.dirpath, f))
+                entries.append((os.path.join(self.dirpath, f), stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda e: e[-1])
+
+    def size(self) -> int:
+        return sum(num_bytes for _, num_bytes, _ in self.list_entries())
+
+    def evict(self, max_bytes: int = None) -> int:
+        """Remove least recently used entries until the cache fits `max_bytes`, returns the count."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.list_entries()
+        total_bytes = sum(num_bytes for _, num_bytes, _ in entries)
+        num_evicted = 0
+        for filepath, num_bytes, _ in entries:
+            if total_bytes <= max_bytes:
+                break
+            os.remove(filepath)
+            total_bytes -= num_bytes
+            num_evicted += 1
+        return num_evicted
+
+    def clear(self) -> int:
+        return self.evict(max_bytes=0)
@@ -0,0 +1,124 @@
+import os
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from sds4gdsp.processor import get_cellsite_lnglat, calc_haversine_distances
+
+class CellDistanceCache:
+    """Cellsite to cellsite great circle distances (in meters) keyed by cellsite code.
+
+    Codes are row positions in the cellsites table (see `encode_cel_uids`). Up to
+    `max_dense_cels` sites, every pair is computed once into a dense float32 matrix
+    (e.g. 1 MB for 500 sites), past that pairs are computed on demand and the last
+    `max_pairs` of them are kept, least recently used first out. A dense cache saved
+    with `save` can be opened with `mmap_mode="r"`, so worker processes read the same
+    pages instead of each holding a copy, and it pickles as its filepath only.
+    `lookup` reads like `NetworkDistanceTable.lookup`, so either can be passed around.
+    """
+
+    def __init__(
+        self, cel_uids, lng, lat, distances: np.ndarray = None,
+        max_pairs: int = 1_000_000, filepath: str = None
+    ):
+        self.cel_uids = pd.Index(cel_uids)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.distances = distances
+        self.max_pairs = max_pairs
+        self.filepath = filepath
+        self.pairs = OrderedDict()
+
+    def __len__(self):
+        return len(self.cel_uids)
+
+    @property
+    def is_dense(self) -> bool:
+        return self.distances is not None
+
+    @classmethod
+    def from_cellsites(
+        cls, cellsites: pd.DataFrame, max_dense_cels: int = 5_000,
+        max_pairs: int = 1_000_000, batch_size: int = 256
+    ) -> "CellDistanceCache":
+        lng, lat = get_cellsite_lnglat(cellsites)
+        num_cels = len(cellsites)
+        distances = None
+        if num_cels <= max_dense_cels:
+            distances = np.empty((num_cels, num_cels), dtype=np.float32)
+            # rows in batches to bound the float64 temporaries
+            for start in range(0, num_cels, batch_size):
+                stop = min(start + batch_size, num_cels)
+                distances[start:stop] = calc_haversine_distances(
+                    lng[start:stop, None], lat[start:stop, None], lng[None, :], lat[None, :]
+                )
+        return cls(cellsites.cel_uid, lng, lat, distances, max_pairs)
+
+    def encode(self, cel_uids) -> np.ndarray:
+        """Map cellsite ids to cellsite codes, raises on unknown ids."""
+        cel_codes = self.cel_uids.get_indexer(np.asarray(cel_uids))
+        if (cel_codes < 0).any():
+            raise KeyError(f"{int((cel_codes < 0).sum())} cellsite id/s are not in the cache")
+        return cel_codes
+
+    def lookup(self, orig_codes, dest_codes) -> np.ndarray:
+        """Read the distances of (orig, dest) cellsite code pairs."""
+        orig_codes = np.asarray(orig_codes, dtype=np.int64)
+        dest_codes = np.asarray(dest_codes, dtype=np.int64)
+        if self.is_dense:
+            return np.asarray(self.distances[orig_codes, dest_codes])
+        # the distance is symmetric, so (i, j) and (j, i) share a key
+        keys = np.minimum(orig_codes, dest_codes) * len(self) + np.maximum(orig_codes, dest_codes)
+        uniq_keys, inverse = np.unique(keys, return_inverse=True)
+        values = np.empty(len(uniq_keys), dtype=np.float32)
+        is_missing = np.ones(len(uniq_keys), dtype=bool)
+        for i, key in enumerate(uniq_keys.tolist()):
+            value = self.pairs.get(key)
+            if value is not None:
+                self.pairs.move_to_end(key)
+                values[i], is_missing[i] = value, False
+        if is_missing.any():
+            missing_keys = uniq_keys[is_missing]
+            orig, dest = missing_keys // len(self), missing_keys % len(self)
+            values[is_missing] = calc_haversine_distances(self.lng[orig], self.lat[orig], self.lng[dest], self.lat[dest])
+            self.pairs.update(zip(missing_keys.tolist(), values[is_missing].tolist()))
+            while len(self.pairs) > self.max_pairs:
+                self.pairs.popitem(last=False)
+        return values[inverse.ravel()].reshape(keys.shape)
+
+    def lookup_uids(self, orig_uids, dest_uids) -> np.ndarray:
+        """Read the distances of (orig, dest) cellsite id pairs."""
+        return self.lookup(self.encode(orig_uids), self.encode(dest_uids))
+
+    def save(self, dirpath: str) -> None:
+        """Persist the cache to a directory, the dense matrix as a plain .npy file to memory map."""
+        os.makedirs(dirpath, exist_ok=True)
+        np.savez(
+            os.path.join(dirpath, "cellsites.npz"),
+            cel_uids=self.cel_uids.to_numpy().astype(str), lng=self.lng, lat=self.lat,
+            max_pairs=np.array(self.max_pairs)
+        )
+        if self.is_dense:
+            np.save(os.path.join(dirpath, "distances.npy"), np.asarray(self.distances))
+
+    @classmethod
+    def load(cls, dirpath: str, mmap_mode: str = "r") -> "CellDistanceCache":
+        """Restore a cache saved with `save`, memory mapping the dense matrix (unless `mmap_mode` is None)."""
+        with np.load(os.path.join(dirpath, "cellsites.npz"), allow_pickle=False) as state:
+            cel_uids, lng, lat = state["cel_uids"].astype(object), state["lng"], state["lat"]
+            max_pairs = int(state["max_pairs"])
+        filepath = os.path.join(dirpath, "distances.npy")
+        distances = np.load(filepath, mmap_mode=mmap_mode) if os.path.exists(filepath) else None
+        return cls(cel_uids, lng, lat, distances, max_pairs, dirpath if mmap_mode else None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # workers get an empty LRU, and reopen the memory mapped matrix instead of a copy
+        state["pairs"] = OrderedDict()
+        if self.filepath is not None:
+            state["distances"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.filepath is not None:
+            self.distances = np.load(os.path.join(self.filepath, "distances.npy"), mmap_mode="r")
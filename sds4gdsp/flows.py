@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sds4gdsp.processor import calc_haversine_distances
+from sds4gdsp.mobility import sort_transactions, get_hop_mask
+from sds4gdsp.io import convert_dates_to_days, convert_days_to_dates
+
+class ODFlows:
+    """Sparse cellsite to cellsite flow counts (and summed travel distance) per hour
+    of day and per date, keyed on integer cellsite codes (row positions in the
+    cellsites table, which must be the same table for every chunk merged together).
+
+    Flows are kept as consolidated COO triplets, i.e. one (layer, orig, dest) key with
+    its count and distance, so chunks and other processes merge by concatenation
+    followed by a sum over duplicate keys. Hops are attributed to the hour and date
+    of their origin transaction.
+    """
+
+    def __init__(self, num_cels: int, include_stays: bool = False):
+        self.num_cels = num_cels
+        self.include_stays = include_stays
+        self.layers = dict(hour=self.empty(), date=self.empty())
+        self.pending = dict(hour=[], date=[])
+
+    @staticmethod
+    def empty():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    def make_keys(self, layers, orig, dest) -> np.ndarray:
+        return (np.asarray(layers, dtype=np.int64) * self.num_cels + orig) * self.num_cels + dest
+
+    def split_keys(self, keys):
+        """Split keys back into (layer, orig, dest)."""
+        layers, rest = np.divmod(keys, self.num_cels * self.num_cels)
+        orig, dest = np.divmod(rest, self.num_cels)
+        return layers, orig, dest
+
+    def consolidate(self, kind: str = None) -> None:
+        """Sum the pending triplets into the consolidated ones."""
+        for kind in [kind] if kind else list(self.pending):
+            if not self.pending[kind]:
+                continue
+            keys, counts, distances = map(np.concatenate, zip(self.layers[kind], *self.pending[kind]))
+            uniq_keys, inverse = np.unique(keys, return_inverse=True)
+            self.layers[kind] = (
+                uniq_keys,
+                np.bincount(inverse, weights=counts, minlength=len(uniq_keys)).astype(np.int64),
+                np.bincount(inverse, weights=distances, minlength=len(uniq_keys))
+            )
+            self.pending[kind] = []
+
+    def add(self, kind: str, layers, orig, dest, distances) -> None:
+        keys = self.make_keys(layers, orig, dest)
+        self.pending[kind].append((keys, np.ones(len(keys), dtype=np.int64), np.asarray(distances, dtype=np.float64)))
+        # bound the memory held by unconsolidated chunks
+        if len(self.pending[kind]) >= 16:
+            self.consolidate(kind)
+
+    def update_arrays(self, offsets, cel_codes, hrs, days, lng, lat) -> None:
+        """Accumulate the hops of transactions sorted by (sub, date, hour) and grouped by `offsets`,
+        the groups must hold complete trajectories (e.g. per sub) for hops to be counted once.
+        """
+        mask = get_hop_mask(offsets)
+        orig, dest = cel_codes[:-1][mask], cel_codes[1:][mask]
+        orig_hrs, orig_days = hrs[:-1][mask], days[:-1][mask]
+        distances = calc_haversine_distances(lng[:-1][mask], lat[:-1][mask], lng[1:][mask], lat[1:][mask])
+        if not self.include_stays:
+            moved = orig != dest
+            orig, dest, orig_hrs, orig_days, distances = orig[moved], dest[moved], orig_hrs[moved], orig_days[moved], distances[moved]
+        self.add("hour", orig_hrs, orig, dest, distances)
+        self.add("date", orig_days, orig, dest, distances)
+
+    def update(self, transactions: pd.DataFrame, cellsites: pd.DataFrame) -> None:
+        """Accumulate the hops of a chunk of transactions holding complete subscriber trajectories."""
+        sorted_transactions, offsets, _ = sort_transactions(transactions, cellsites, window="month")
+        self.update_arrays(
+            offsets,
+            sorted_transactions.cel_code.to_numpy(),
+            sorted_transactions.transaction_hr.to_numpy(),
+            convert_dates_to_days(sorted_transactions.transaction_dt),
+            sorted_transactions.lng.to_numpy(),
+            sorted_transactions.lat.to_numpy()
+        )
+
+    def merge(self, other: "ODFlows") -> "ODFlows":
+        """Add the flows of another accumulator (e.g. from another chunk or process) in place."""
+        if other.num_cels != self.num_cels:
+            raise ValueError(f"cannot merge flows over {other.num_cels} cellsites into {self.num_cels}")
+        other.consolidate()
+        for kind in self.layers:
+            self.pending[kind].append(other.layers[kind])
+        self.consolidate()
+        return self
+
+    def get_matrices(self, kind: str, layer: int = None):
+        """Fetch the (counts, distances) CSR matrices of a layer, or summed over all layers."""
+        self.consolidate(kind)
+        keys, counts, distances = self.layers[kind]
+        layers, orig, dest = self.split_keys(keys)
+        if layer is not None:
+            selected = layers == layer
+            counts, distances, orig, dest = counts[selected], distances[selected], orig[selected], dest[selected]
+        shape = (self.num_cels, self.num_cels)
+        # csr sums the duplicate (orig, dest) pairs across layers
+        return (
+            sparse.csr_matrix((counts, (orig, dest)), shape=shape),
+            sparse.csr_matrix((distances, (orig, dest)), shape=shape)
+        )
+
+    def get_hourly(self, hr: int):
+        return self.get_matrices("hour", hr)
+
+    def get_daily(self, date: str):
+        return self.get_matrices("date", int(convert_dates_to_days([date])[0]))
+
+    def get_total(self):
+        return self.get_matrices("hour")
+
+    def list_dates(self):
+        self.consolidate("date")
+        layers, _, _ = self.split_keys(self.layers["date"][0])
+        return convert_days_to_dates(np.unique(layers)).tolist()
+
+    def to_frame(self, kind: str = "hour") -> pd.DataFrame:
+        """Fetch the flows as a long table, one row per (hour or date, orig, dest) with flows."""
+        self.consolidate(kind)
+        keys, counts, distances = self.layers[kind]
+        layers, orig, dest = self.split_keys(keys)
+        layer_col = "orig_hr" if kind == "hour" else "orig_dt"
+        layers = layers if kind == "hour" else convert_days_to_dates(layers)
+        return pd.DataFrame({
+            layer_col: layers, "orig_cel_code": orig, "dest_cel_code": dest,
+            "num_hops": counts, "travel_distance": distances
+        })
+
+    def save(self, path: str) -> None:
+        self.consolidate()
+        np.savez_compressed(
+            path,
+            num_cels=np.array(self.num_cels),
+            include_stays=np.array(self.include_stays),
+            **{f"{kind}_{name}": array for kind in self.layers for name, array in zip(["keys", "counts", "distances"], self.layers[kind])}
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ODFlows":
+        with np.load(path, allow_pickle=False) as state:
+            flows = cls(int(state["num_cels"]), bool(state["include_stays"]))
+            for kind in flows.layers:
+                flows.layers[kind] = tuple(state[f"{kind}_{name}"] for name in ["keys", "counts", "distances"])
+        return flows
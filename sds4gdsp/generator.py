@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+from sds4gdsp.processor import (
+    HRS_IN_A_DAY, get_truncated_normal, get_cellsite_lnglat, dedupe_points
+)
+
+def format_uids(prefix: str, start: int, stop: int, width: int = 3) -> np.ndarray:
+    """Format the ids `{prefix}{i+1}` for i in [start, stop) in bulk, zero padded to `width`."""
+    if stop <= start:
+        return np.empty(0, dtype=object)
+    numbers = np.char.zfill(np.arange(start + 1, stop + 1).astype(str), width)
+    return np.char.add(prefix, numbers).astype(object)
+
+def make_dates(start_date: str, num_days: int) -> np.ndarray:
+    """Make the ISO date strings of the simulated period."""
+    return pd.date_range(start_date, periods=num_days, freq="D").strftime("%Y-%m-%d").to_numpy()
+
+def simulate_hops(stay_probas, neighbors, num_days: int, cap_start_hr: int, rng: np.random.Generator):
+    """Simulate the hourly cellsite hops of a batch of subscribers over `num_days`.
+
+    Every subscriber starts at a random site and a random hour below `cap_start_hr`,
+    each day restarts at that hour from the last site visited, and every later hour
+    hops (with proba 1 - stay_proba) to one of the k nearest neighbors of the current
+    site with equal weighting. All subscribers of the batch are stepped together.
+    Returns the (sub, day, hr, site) positions of the transactions, sorted.
+    """
+    num_subs = len(stay_probas)
+    num_sites, k = neighbors.shape
+    hop_probas = 1 - np.asarray(stay_probas, dtype=np.float64)
+    curr_hr = rng.integers(cap_start_hr, size=num_subs)
+    curr_loc = rng.integers(num_sites, size=num_subs)
+    # preallocate for the worst case of a transaction every hour
+    capacity = num_subs * num_days * HRS_IN_A_DAY
+    subs = np.empty(capacity, dtype=np.int64)
+    days = np.empty(capacity, dtype=np.int32)
+    hrs = np.empty(capacity, dtype=np.int8)
+    locs = np.empty(capacity, dtype=np.int64)
+    cursor = 0
+    sub_idx = np.arange(num_subs)
+    for day in range(num_days):
+        # the first transaction of the day is where the sub was left
+        stop = cursor + num_subs
+        subs[cursor:stop], days[cursor:stop], hrs[cursor:stop], locs[cursor:stop] = sub_idx, day, curr_hr, curr_loc
+        cursor = stop
+        for hr in range(1, HRS_IN_A_DAY):
+            with_transaction = (hr > curr_hr) & (rng.random(num_subs) < hop_probas)
+            choices = rng.integers(k, size=num_subs)
+            movers = np.flatnonzero(with_transaction)
+            curr_loc[movers] = neighbors[curr_loc[movers], choices[movers]]
+            stop = cursor + len(movers)
+            subs[cursor:stop], days[cursor:stop], hrs[cursor:stop], locs[cursor:stop] = movers, day, hr, curr_loc[movers]
+            cursor = stop
+    # rows were written in (day, hr) order, a stable sort on sub finishes the job
+    order = np.argsort(subs[:cursor], kind="stable")
+    return subs[order], days[order], hrs[order], locs[order]
+
+def simulate_transactions(
+    sub_uids, stay_probas, cel_uids, neighbors, start_date: str, num_days: int,
+    cap_start_hr: int, rng: np.random.Generator, batch_size: int = 10_000
+):
+    """Yield fake transactions (without txn_uid) in chunks of `batch_size` subscribers."""
+    sub_uids, stay_probas = np.asarray(sub_uids), np.asarray(stay_probas)
+    cel_uids, neighbors = np.asarray(cel_uids), np.asarray(neighbors)
+    dates = make_dates(start_date, num_days)
+    for start in range(0, len(sub_uids), batch_size):
+        stop = min(start + batch_size, len(sub_uids))
+        subs, days, hrs, locs = simulate_hops(stay_probas[start:stop], neighbors, num_days, cap_start_hr, rng)
+        yield pd.DataFrame(dict(
+            sub_uid=sub_uids[start:stop][subs],
+            cel_uid=cel_uids[locs],
+            transaction_dt=dates[days],
+            transaction_hr=hrs.astype(np.int64)
+        ))
+
+def make_name_pool(size: int, rng: np.random.Generator):
+    """Make `size` male and `size` female fake names to sample subscriber names from,
+    calling Faker per name only for the pool rather than per subscriber.
+    """
+    from faker import Faker
+    # names follow the same random stream as the other fields
+    fake = Faker()
+    fake.seed_instance(int(rng.integers(2**32)))
+    male_names = np.array([fake.name_male() for _ in range(size)], dtype=object)
+    female_names = np.array([fake.name_female() for _ in range(size)], dtype=object)
+    return male_names, female_names
+
+def simulate_subscribers(
+    start: int, stop: int, min_age: int, max_age: int, male_names, female_names, rng: np.random.Generator
+) -> pd.DataFrame:
+    """Simulate the fake subscribers `glo-sub-{start+1}` up to `glo-sub-{stop}`, each field drawn in bulk."""
+    num_subs = stop - start
+    gender = rng.choice(np.array(["male", "female"], dtype=object), size=num_subs)
+    is_male = gender == "male"
+    name = np.where(
+        is_male,
+        male_names[rng.integers(len(male_names), size=num_subs)],
+        female_names[rng.integers(len(female_names), size=num_subs)]
+    )
+    return pd.DataFrame(dict(
+        sub_uid=format_uids("glo-sub-", start, stop),
+        gender=gender,
+        age=rng.integers(min_age, max_age + 1, size=num_subs),
+        name=name,
+        chi_indicator=rng.integers(2, size=num_subs),
+        ewallet_user_indicator=rng.choice(np.array(["Y", "N"], dtype=object), size=num_subs)
+    ))
+
+def make_subscribers(
+    start: int, stop: int, min_age: int, max_age: int, rng: np.random.Generator,
+    batch_size: int = 1_000_000, name_pool_size: int = 5_000
+):
+    """Yield the fake subscribers `glo-sub-{start+1}` up to `glo-sub-{stop}` in chunks of `batch_size`."""
+    male_names, female_names = make_name_pool(name_pool_size, rng)
+    # an empty range still yields an (empty) chunk so that its part-file gets a header
+    for batch_start in range(start, stop, batch_size) or [start]:
+        batch_stop = min(batch_start + batch_size, stop)
+        yield simulate_subscribers(batch_start, batch_stop, min_age, max_age, male_names, female_names, rng)
+
+def make_cellsites(G, min_distance: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Make the fake cellsites on the road intersections (nodes) of a graph, taken in
+    random order then deduped so that no two sites are within `min_distance` meters.
+    """
+    from sds4gdsp.geometry import PointArray
+    nodes = list(G.nodes)
+    nodes = [nodes[i] for i in rng.permutation(len(nodes))]
+    deduped_points = dedupe_points(PointArray.from_graph(G, nodes), min_distance)
+    return pd.DataFrame(dict(
+        cel_uid=format_uids("glo-cel-", 0, len(deduped_points)),
+        coords=deduped_points
+    ))
+
+def make_neighbors(cellsites: pd.DataFrame, k: int) -> np.ndarray:
+    """Fetch the k nearest sites of every cellsite, row i holds the positions of the neighbors of site i."""
+    from sds4gdsp.indexer import CellsiteIndex
+    lng, lat = get_cellsite_lnglat(cellsites)
+    _, neighbors = CellsiteIndex(lng, lat).query_self_knn(k)
+    return neighbors
+
+def draw_stay_probas(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Draw the stay proba of each sub, rounded to a single decimal."""
+    # assumption: stay proba of subs exhibit a normal dist with the ff params
+    mean_tnorm_dist = 0.5
+    sd_tnorm_dist = 0.1
+    low_tnorm_dist = 0.1
+    upp_tnorm_dist = 0.9
+    tnorm_dist = get_truncated_normal(
+        mean=mean_tnorm_dist,
+        sd=sd_tnorm_dist,
+        low=low_tnorm_dist,
+        upp=upp_tnorm_dist
+    )
+    return np.round(tnorm_dist.rvs(size, random_state=rng), 1)
+
+def make_transactions(
+    sub_uids, cel_uids, neighbors, start_date: str, num_days: int, cap_start_hr: int,
+    rng: np.random.Generator, batch_size: int = 10_000, txn_prefix: str = "glo-txn-"
+):
+    """Yield fake transactions, txn_uid included, for the given subs in chunks."""
+    # perform row shuffling of the subs
+    sub_uids = np.asarray(sub_uids)[rng.permutation(len(sub_uids))]
+    # this adds variability to the mobility patterns of the subs, there
+    # should be subs with low mobility (high stay proba) and vice versa
+    stay_probas = draw_stay_probas(len(sub_uids), rng)
+    chunks = simulate_transactions(
+        sub_uids, stay_probas, cel_uids, neighbors, start_date, num_days, cap_start_hr, rng, batch_size
+    )
+    num_transactions = 0
+    for chunk in chunks:
+        chunk.insert(0, "txn_uid", format_uids(txn_prefix, num_transactions, num_transactions+len(chunk), width=5))
+        num_transactions += len(chunk)
+        yield chunk
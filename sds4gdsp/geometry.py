@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+from typing import List, Sequence, TYPE_CHECKING
+from sds4gdsp.processor import (
+    parse_wkt_points, get_points_lnglat, calc_haversine_distances
+)
+
+if TYPE_CHECKING:
+    from networkx import Graph
+
+# little endian WKB of a 2D point: byte order, geometry type, x, y
+WKB_POINT_DTYPE = np.dtype([("order", "u1"), ("type", "<u4"), ("x", "<f8"), ("y", "<f8")])
+WKB_LINESTRING_HEADER_DTYPE = np.dtype([("order", "u1"), ("type", "<u4"), ("num_points", "<u4")])
+
+def get_node_coords(G: "Graph", nodes: Sequence = None):
+    """Fetch the lng/lat arrays of graph nodes (all of them by default) in a single pass
+    over the node attributes, instead of one `G.nodes[node]` lookup per node.
+    """
+    node_ids = pd.Index(list(G.nodes))
+    lng = np.fromiter((x for _, x in G.nodes(data="x")), dtype=np.float64, count=len(node_ids))
+    lat = np.fromiter((y for _, y in G.nodes(data="y")), dtype=np.float64, count=len(node_ids))
+    if nodes is None:
+        return lng, lat
+    positions = node_ids.get_indexer(list(nodes))
+    if (positions < 0).any():
+        raise KeyError(f"{int((positions < 0).sum())} node/s are not in the graph")
+    return lng[positions], lat[positions]
+
+class PointArray:
+    """A collection of points as two float64 coordinate arrays.
+
+    This takes 16 bytes per point instead of a shapely object each, shapely
+    geometries are only built on demand with `to_shapely` or `to_geoseries`.
+    """
+
+    def __init__(self, lng, lat):
+        self.lng = np.ascontiguousarray(lng, dtype=np.float64)
+        self.lat = np.ascontiguousarray(lat, dtype=np.float64)
+        if self.lng.shape != self.lat.shape or self.lng.ndim != 1:
+            raise ValueError("lng and lat should be 1D arrays of the same length")
+
+    def __len__(self):
+        return len(self.lng)
+
+    def __getitem__(self, key) -> "PointArray":
+        """Select points by slice, boolean mask or positions."""
+        return PointArray(self.lng[key], self.lat[key])
+
+    @property
+    def coords(self) -> np.ndarray:
+        return np.column_stack([self.lng, self.lat])
+
+    @classmethod
+    def from_coords(cls, coords) -> "PointArray":
+        """Build from a n x 2 array (or sequence of (lng, lat) tuples)."""
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        return cls(coords[:, 0], coords[:, 1])
+
+    @classmethod
+    def from_wkt(cls, wkts: List[str]) -> "PointArray":
+        return cls.from_coords(parse_wkt_points(list(wkts)))
+
+    @classmethod
+    def from_wkb(cls, wkbs: List[bytes]) -> "PointArray":
+        """Build from 2D point WKBs (bytes, or hex strings) in a single buffer read."""
+        wkbs = [bytes.fromhex(w) if isinstance(w, str) else w for w in wkbs]
+        if any(len(w) != WKB_POINT_DTYPE.itemsize or w[0] != 1 for w in wkbs):
+            raise ValueError("expected little endian 2D point WKBs")
+        records = np.frombuffer(b"".join(wkbs), dtype=WKB_POINT_DTYPE)
+        if (records["type"] != 1).any():
+            raise ValueError("expected point WKBs only")
+        return cls(records["x"], records["y"])
+
+    @classmethod
+    def from_shapely(cls, points) -> "PointArray":
+        return cls.from_coords(get_points_lnglat(list(points)))
+
+    @classmethod
+    def from_graph(cls, G: "Graph", nodes: Sequence = None) -> "PointArray":
+        return cls(*get_node_coords(G, nodes))
+
+    def to_wkt(self) -> np.ndarray:
+        # repr keeps the shortest string that round trips to the same float
+        return np.array([f"POINT ({x!r} {y!r})" for x, y in zip(self.lng.tolist(), self.lat.tolist())], dtype=object)
+
+    def to_wkb(self) -> List[bytes]:
+        records = np.empty(len(self), dtype=WKB_POINT_DTYPE)
+        records["order"], records["type"] = 1, 1
+        records["x"], records["y"] = self.lng, self.lat
+        buffer, size = records.tobytes(), WKB_POINT_DTYPE.itemsize
+        return [buffer[i:i+size] for i in range(0, len(buffer), size)]
+
+    def to_shapely(self) -> list:
+        from shapely.geometry import Point
+        return [Point(x, y) for x, y in zip(self.lng.tolist(), self.lat.tolist())]
+
+    def to_geoseries(self, crs=None):
+        import geopandas as gpd
+        return gpd.GeoSeries(gpd.points_from_xy(self.lng, self.lat), crs=crs)
+
+class LineArray:
+    """A collection of polylines as flat float64 coordinate arrays plus offsets,
+    polyline i holds the coordinates in [offsets[i], offsets[i+1]).
+    """
+
+    def __init__(self, lng, lat, offsets):
+        self.lng = np.ascontiguousarray(lng, dtype=np.float64)
+        self.lat = np.ascontiguousarray(lat, dtype=np.float64)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        if self.lng.shape != self.lat.shape or self.offsets[-1] != len(self.lng):
+            raise ValueError("offsets should end at the number of coordinates")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def num_coords(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def get_coords(self, i: int) -> np.ndarray:
+        start, stop = self.offsets[i], self.offsets[i+1]
+        return np.column_stack([self.lng[start:stop], self.lat[start:stop]])
+
+    def get_points(self) -> PointArray:
+        """Fetch all coordinates as points, e.g. to plot the vertices."""
+        return PointArray(self.lng, self.lat)
+
+    @classmethod
+    def from_coords(cls, lines) -> "LineArray":
+        """Build from a sequence of coordinate sequences, one per polyline."""
+        lines = [np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines]
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(line) for line in lines])
+        coords = np.vstack(lines) if lines else np.empty((0, 2))
+        return cls(coords[:, 0], coords[:, 1], offsets)
+
+    @classmethod
+    def from_segments(cls, orig_lng, orig_lat, dest_lng, dest_lat) -> "LineArray":
+        """Build two point lines (e.g. origin-destination hops) from coordinate arrays."""
+        lng = np.column_stack([orig_lng, dest_lng]).ravel()
+        lat = np.column_stack([orig_lat, dest_lat]).ravel()
+        return cls(lng, lat, np.arange(0, len(lng) + 1, 2))
+
+    @classmethod
+    def from_path(cls, points: PointArray) -> "LineArray":
+        """Build the segments between consecutive points of a path."""
+        return cls.from_segments(points.lng[:-1], points.lat[:-1], points.lng[1:], points.lat[1:])
+
+    @classmethod
+    def from_routes(cls, G: "Graph", routes: List[Sequence]) -> "LineArray":
+        """Build one polyline per route (a sequence of graph nodes), reading node coordinates once."""
+        offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(route) for route in routes])
+        nodes = [node for route in routes for node in route]
+        return cls(*get_node_coords(G, nodes), offsets)
+
+    @classmethod
+    def from_wkt(cls, wkts: List[str]) -> "LineArray":
+        """Build from `LINESTRING (x y, x y, ...)` strings."""
+        bodies = [w[w.index("(")+1:w.rindex(")")] if "(" in w else "" for w in wkts]
+        offsets = np.zeros(len(bodies) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([body.count(",") + 1 if body.strip() else 0 for body in bodies])
+        values = " ".join(bodies).replace(",", " ").split()
+        coords = np.array(values, dtype=np.float64).reshape(-1, 2)
+        return cls(coords[:, 0], coords[:, 1], offsets)
+
+    @classmethod
+    def from_wkb(cls, wkbs: List[bytes]) -> "LineArray":
+        """Build from little endian 2D linestring WKBs (bytes, or hex strings)."""
+        wkbs = [bytes.fromhex(w) if isinstance(w, str) else w for w in wkbs]
+        size = WKB_LINESTRING_HEADER_DTYPE.itemsize
+        headers = np.frombuffer(b"".join(w[:size] for w in wkbs), dtype=WKB_LINESTRING_HEADER_DTYPE)
+        if (headers["order"] != 1).any() or (headers["type"] != 2).any():
+            raise ValueError("expected little endian 2D linestring WKBs")
+        offsets = np.zeros(len(wkbs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(headers["num_points"])
+        coords = np.frombuffer(b"".join(w[size:] for w in wkbs), dtype="<f8").reshape(-1, 2)
+        return cls(coords[:, 0], coords[:, 1], offsets)
+
+    @classmethod
+    def from_shapely(cls, lines) -> "LineArray":
+        return cls.from_coords([line.coords for line in lines])
+
+    def to_wkt(self) -> np.ndarray:
+        coords = [f"{x!r} {y!r}" for x, y in zip(self.lng.tolist(), self.lat.tolist())]
+        return np.array([
+            f"LINESTRING ({', '.join(coords[start:stop])})" if stop > start else "LINESTRING EMPTY"
+            for start, stop in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())
+        ], dtype=object)
+
+    def to_wkb(self) -> List[bytes]:
+        headers = np.empty(len(self), dtype=WKB_LINESTRING_HEADER_DTYPE)
+        headers["order"], headers["type"], headers["num_points"] = 1, 2, self.num_coords
+        header_bytes = headers.tobytes()
+        coord_bytes = np.column_stack([self.lng, self.lat]).astype("<f8").tobytes()
+        size, coord_size = WKB_LINESTRING_HEADER_DTYPE.itemsize, 16
+        return [
+            header_bytes[i*size:(i+1)*size] + coord_bytes[start*coord_size:stop*coord_size]
+            for i, (start, stop) in enumerate(zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist()))
+        ]
+
+    def to_shapely(self) -> list:
+        import shapely
+        if hasattr(shapely, "linestrings"): # shapely 2 builds them in bulk
+            line_ids = np.repeat(np.arange(len(self)), self.num_coords)
+            return list(shapely.linestrings(np.column_stack([self.lng, self.lat]), indices=line_ids))
+        from shapely.geometry import LineString
+        return [LineString(self.get_coords(i)) for i in range(len(self))]
+
+    def to_geoseries(self, crs=None):
+        import geopandas as gpd
+        return gpd.GeoSeries(self.to_shapely(), crs=crs)
+
+    def calc_lengths(self) -> np.ndarray:
+        """Compute for the haversine length (in meters) of every polyline."""
+        distances = calc_haversine_distances(self.lng[:-1], self.lat[:-1], self.lng[1:], self.lat[1:])
+        # drop the segments that would bridge two polylines
+        is_inner = np.ones(len(distances), dtype=bool)
+        boundaries = self.offsets[1:-1]
+        is_inner[boundaries[(boundaries > 0) & (boundaries < len(self.lng))] - 1] = False
+        line_ids = np.repeat(np.arange(len(self)), self.num_coords)[:-1]
+        return np.bincount(line_ids[is_inner], weights=distances[is_inner], minlength=len(self))
@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+from sds4gdsp.processor import (
+    R_EARTH, calc_haversine_distances, calc_elapsed_hours, get_cellsite_lnglat
+)
+from sds4gdsp.mobility import sort_transactions, calc_group_travel_distances, get_group_ids, get_hop_mask
+
+class MobilityAccumulator:
+    """Month-to-date mobility indices per subscriber, updated one day at a time.
+
+    The state per subscriber is the running travel distance, the last cellsite and
+    hour seen, the number of points with their coordinate sums and sums of squares,
+    and the hours spent per cellsite. Appending a day only touches that day's data.
+    The radius of gyration is rebuilt from the sums with an equirectangular
+    approximation around the center of mass, which is well within a meter of the
+    haversine based one at town scale. Per subscriber arrays keep spare rows that
+    double when full, so new subscribers do not copy the whole state every day.
+    """
+
+    def __init__(self, cellsites: pd.DataFrame, month: str = None):
+        self.cellsites = cellsites
+        self.cel_lng, self.cel_lat = get_cellsite_lnglat(cellsites)
+        self.num_cels = len(cellsites)
+        self.month = month
+        self.last_dt = None
+        self.sub_rows = {}
+        self.num_subs = 0
+        self.sub_uids = np.empty(0, dtype=object)
+        self.num_points = np.empty(0, dtype=np.int64)
+        self.dist_sum = np.empty(0, dtype=np.float64)
+        self.last_cel = np.empty(0, dtype=np.int64)
+        self.last_hr = np.empty(0, dtype=np.int64)
+        self.coord_sums = np.empty((0, 4), dtype=np.float64) # lng, lat, lng^2, lat^2
+        # hours spent per (sub row, cellsite) keyed as row * num_cels + cel code, sorted by key
+        self.dwell_keys = np.empty(0, dtype=np.int64)
+        self.dwell_hrs = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return self.num_subs
+
+    def grow(self, num_rows: int) -> None:
+        """Make room for `num_rows` subscribers, at least doubling the capacity when full."""
+        capacity = len(self.sub_uids)
+        if num_rows <= capacity:
+            return
+        capacity = max(num_rows, 2 * capacity, 1024)
+        def resize(arr, fill):
+            resized = np.full((capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+            resized[:self.num_subs] = arr[:self.num_subs]
+            return resized
+        self.sub_uids = resize(self.sub_uids, None)
+        self.num_points = resize(self.num_points, 0)
+        self.dist_sum = resize(self.dist_sum, 0)
+        self.last_cel = resize(self.last_cel, -1)
+        self.last_hr = resize(self.last_hr, 0)
+        self.coord_sums = resize(self.coord_sums, 0)
+
+    def get_sub_rows(self, sub_uids) -> np.ndarray:
+        """Fetch the state rows of the subscribers, allocating rows for new ones."""
+        new_subs = [s for s in pd.unique(np.asarray(sub_uids)) if s not in self.sub_rows]
+        if new_subs:
+            num_new = len(new_subs)
+            self.grow(self.num_subs + num_new)
+            self.sub_rows.update(zip(new_subs, range(self.num_subs, self.num_subs + num_new)))
+            self.sub_uids[self.num_subs:self.num_subs+num_new] = new_subs
+            self.num_subs += num_new
+        return np.array([self.sub_rows[s] for s in sub_uids], dtype=np.int64)
+
+    def add_dwell_hrs(self, keys: np.ndarray, hrs: np.ndarray) -> None:
+        """Add hours to the sorted dwell state, only sorting the new keys."""
+        day_keys, inverse = np.unique(keys, return_inverse=True)
+        day_hrs = np.bincount(inverse, weights=hrs, minlength=len(day_keys))
+        positions = np.searchsorted(self.dwell_keys, day_keys)
+        exists = np.zeros(len(day_keys), dtype=bool)
+        is_inside = positions < len(self.dwell_keys)
+        exists[is_inside] = self.dwell_keys[positions[is_inside]] == day_keys[is_inside]
+        np.add.at(self.dwell_hrs, positions[exists], day_hrs[exists])
+        self.dwell_keys = np.insert(self.dwell_keys, positions[~exists], day_keys[~exists])
+        self.dwell_hrs = np.insert(self.dwell_hrs, positions[~exists], day_hrs[~exists])
+
+    def update(self, transactions: pd.DataFrame) -> None:
+        """Append a single day of transactions to the month-to-date state."""
+        dts = pd.unique(transactions.transaction_dt)
+        if len(dts) != 1:
+            raise ValueError(f"expected a single day of transactions, got {len(dts)}")
+        dt = str(dts[0])
+        month = dt[:7] + "-01"
+        if self.month is None:
+            self.month = month
+        if month != self.month:
+            raise ValueError(f"day {dt} is outside of month {self.month}, start a new accumulator")
+        if self.last_dt is not None and dt <= self.last_dt:
+            raise ValueError(f"day {dt} was already appended, last day is {self.last_dt}")
+        sorted_transactions, offsets, groups = sort_transactions(transactions, self.cellsites, window="day")
+        lng = sorted_transactions.lng.to_numpy()
+        lat = sorted_transactions.lat.to_numpy()
+        cel_codes = sorted_transactions.cel_code.to_numpy()
+        hrs = sorted_transactions.transaction_hr.to_numpy()
+        rows = self.get_sub_rows(groups.sub_uid)
+        first, last = offsets[:-1], offsets[1:] - 1
+        # hops within the day
+        group_ids = get_group_ids(offsets)
+        mask = get_hop_mask(offsets)
+        self.dist_sum[rows] += calc_group_travel_distances(offsets, lng, lat)
+        hop_rows = rows[group_ids[:-1][mask]]
+        hop_cels = cel_codes[:-1][mask]
+        hop_hrs = calc_elapsed_hours(hrs[:-1][mask], hrs[1:][mask])
+        # hop from the last site of the previous day, wraps around like `calc_activity_entropy`
+        seen = self.last_cel[rows] >= 0
+        prev_rows, prev_cels = rows[seen], self.last_cel[rows[seen]]
+        self.dist_sum[prev_rows] += calc_haversine_distances(
+            self.cel_lng[prev_cels], self.cel_lat[prev_cels], lng[first[seen]], lat[first[seen]]
+        )
+        hop_rows = np.concatenate([hop_rows, prev_rows])
+        hop_cels = np.concatenate([hop_cels, prev_cels])
+        hop_hrs = np.concatenate([hop_hrs, calc_elapsed_hours(self.last_hr[prev_rows], hrs[first[seen]])])
+        self.add_dwell_hrs(hop_rows * self.num_cels + hop_cels, hop_hrs)
+        # points for the center of mass and radius of gyration
+        values = np.column_stack([lng, lat, lng ** 2, lat ** 2])
+        self.coord_sums[rows] += np.add.reduceat(values, first, axis=0) if len(values) else 0
+        self.num_points[rows] += np.diff(offsets)
+        self.last_cel[rows] = cel_codes[last]
+        self.last_hr[rows] = hrs[last]
+        self.last_dt = dt
+
+    def calc_radius_of_gyrations(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            num_points = self.num_points[:len(self), None]
+            mean_lng, mean_lat, mean_sq_lng, mean_sq_lat = (self.coord_sums[:len(self)] / num_points).T
+            var_lng = np.clip(mean_sq_lng - mean_lng ** 2, 0, None)
+            var_lat = np.clip(mean_sq_lat - mean_lat ** 2, 0, None)
+        # squared distance to the center of mass, in radians on a local flat plane
+        mean_sq_dist = np.radians(1) ** 2 * (var_lat + np.cos(np.radians(mean_lat)) ** 2 * var_lng)
+        return R_EARTH * np.sqrt(mean_sq_dist)
+
+    def calc_activity_entropies(self) -> np.ndarray:
+        rows = self.dwell_keys // self.num_cels
+        total_hrs = np.bincount(rows, weights=self.dwell_hrs, minlength=len(self))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            probas = self.dwell_hrs / total_hrs[rows]
+            terms = np.where(probas > 0, probas * np.log2(1 / probas), 0)
+        activity_entropies = np.bincount(rows, weights=terms, minlength=len(self))
+        activity_entropies[total_hrs == 0] = np.nan
+        return activity_entropies
+
+    def get_results(self) -> pd.DataFrame:
+        """Fetch the month-to-date mobility indices, same layout as `calc_mobility_indices`."""
+        return pd.DataFrame(dict(
+            sub_uid=self.sub_uids[:len(self)],
+            transaction_dt=self.month,
+            total_travel_distance=self.dist_sum[:len(self)],
+            radius_of_gyration=self.calc_radius_of_gyrations(),
+            activity_entropy=self.calc_activity_entropies()
+        )).sort_values(by="sub_uid").reset_index(drop=True)
+
+    def save(self, path: str) -> None:
+        """Persist the state to a compressed npz file."""
+        np.savez_compressed(
+            path,
+            month=np.array(self.month or ""),
+            last_dt=np.array(self.last_dt or ""),
+            sub_uids=self.sub_uids[:len(self)].astype(str),
+            num_points=self.num_points[:len(self)],
+            dist_sum=self.dist_sum[:len(self)],
+            last_cel=self.last_cel[:len(self)],
+            last_hr=self.last_hr[:len(self)],
+            coord_sums=self.coord_sums[:len(self)],
+            dwell_keys=self.dwell_keys,
+            dwell_hrs=self.dwell_hrs
+        )
+
+    @classmethod
+    def load(cls, path: str, cellsites: pd.DataFrame):
+        """Restore a state saved with `save`, the cellsites table must be the same."""
+        with np.load(path, allow_pickle=False) as state:
+            accumulator = cls(cellsites, month=str(state["month"]) or None)
+            accumulator.last_dt = str(state["last_dt"]) or None
+            accumulator.sub_uids = state["sub_uids"].astype(object)
+            accumulator.num_subs = len(accumulator.sub_uids)
+            accumulator.sub_rows = dict(zip(accumulator.sub_uids, range(accumulator.num_subs)))
+            accumulator.num_points = state["num_points"]
+            accumulator.dist_sum = state["dist_sum"]
+            accumulator.last_cel = state["last_cel"]
+            accumulator.last_hr = state["last_hr"]
+            accumulator.coord_sums = state["coord_sums"]
+            accumulator.dwell_keys = state["dwell_keys"]
+            accumulator.dwell_hrs = state["dwell_hrs"]
+        return accumulator
@@ -0,0 +1,81 @@
+import numpy as np
+from typing import List
+from scipy.spatial import cKDTree
+from sds4gdsp.processor import (
+    R_EARTH, get_lnglat_from_wkt, calc_haversine_distances
+)
+
+def convert_lnglat_to_xyz(lng, lat) -> np.ndarray:
+    """Project lng/lat degrees onto the unit sphere as 3d cartesian coords."""
+    lng, lat = np.radians(np.asarray(lng, dtype=np.float64)), np.radians(np.asarray(lat, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)])
+
+def convert_meters_to_chord(distance) -> np.ndarray:
+    """Convert a great circle distance in meters to a chord length on the unit sphere."""
+    angle = np.clip(np.asarray(distance, dtype=np.float64) / R_EARTH, 0, np.pi)
+    return 2 * np.sin(angle / 2)
+
+class CellsiteIndex:
+    """Spatial index of cellsites for radius and k-nearest-neighbor queries in meters.
+
+    Points are stored as a kd-tree over their unit sphere coordinates, the chord
+    length there is monotonic with the great circle distance, so the tree ranks
+    neighbors exactly the way haversine does. Build and queries are n log n.
+    """
+
+    def __init__(self, lng, lat):
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.tree = cKDTree(convert_lnglat_to_xyz(self.lng, self.lat))
+
+    @classmethod
+    def from_wkt(cls, coords: List[str]):
+        return cls(*get_lnglat_from_wkt(coords))
+
+    def __len__(self):
+        return len(self.lng)
+
+    def query_radius(self, lng, lat, radius: float) -> List[np.ndarray]:
+        """Fetch the indices of the indexed points within `radius` meters of each query point."""
+        xyz = convert_lnglat_to_xyz(np.atleast_1d(lng), np.atleast_1d(lat))
+        # pad the chord a bit, the exact haversine check below removes the extras
+        candidates = self.tree.query_ball_point(xyz, convert_meters_to_chord(radius) * (1 + 1e-9))
+        neighbors = []
+        for q_lng, q_lat, idx in zip(np.atleast_1d(lng), np.atleast_1d(lat), candidates):
+            idx = np.asarray(idx, dtype=np.int64)
+            distances = calc_haversine_distances(q_lng, q_lat, self.lng[idx], self.lat[idx])
+            neighbors.append(np.sort(idx[distances <= radius]))
+        return neighbors
+
+    def query_pairs(self, radius: float) -> np.ndarray:
+        """Fetch all (i, j) index pairs, i < j, of indexed points within `radius` meters."""
+        pairs = self.tree.query_pairs(convert_meters_to_chord(radius) * (1 + 1e-9), output_type="ndarray")
+        if len(pairs) == 0:
+            return np.empty((0, 2), dtype=np.int64)
+        pairs = np.sort(pairs, axis=1)
+        i, j = pairs[:, 0], pairs[:, 1]
+        distances = calc_haversine_distances(self.lng[i], self.lat[i], self.lng[j], self.lat[j])
+        return pairs[distances <= radius]
+
+    def query_knn(self, lng, lat, k: int):
+        """Fetch the haversine distances (in meters) and indices of the k nearest indexed points."""
+        xyz = convert_lnglat_to_xyz(np.atleast_1d(lng), np.atleast_1d(lat))
+        k = min(k, len(self))
+        _, idx = self.tree.query(xyz, k=k)
+        idx = idx.reshape(len(xyz), k)
+        distances = calc_haversine_distances(
+            np.atleast_1d(lng)[:, None], np.atleast_1d(lat)[:, None], self.lng[idx], self.lat[idx]
+        )
+        return distances, idx
+
+    def query_self_knn(self, k: int):
+        """Fetch the k nearest neighbors of every indexed point, excluding the point itself."""
+        k = min(k, len(self) - 1)
+        distances, idx = self.query_knn(self.lng, self.lat, k + 1)
+        # drop the point itself, or the farthest candidate if a duplicate
+        # location outranked it so that every row keeps exactly k neighbors
+        is_self = idx == np.arange(len(self))[:, None]
+        is_self[~is_self.any(axis=1), -1] = True
+        keep = ~is_self
+        return distances[keep].reshape(-1, k), idx[keep].reshape(-1, k)
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import List
+from sds4gdsp.processor import get_cellsite_lnglat
+
+EPOCH = np.datetime64("1970-01-01", "D")
+TRANSACTION_COLUMNS = ["txn_uid", "sub_uid", "cel_uid", "transaction_dt", "transaction_hr"]
+
+def convert_dates_to_days(dates) -> np.ndarray:
+    """Convert ISO date strings into integer days since epoch."""
+    dates = pd.Index(np.asarray(dates))
+    uniq_dates, codes = np.unique(dates.astype(str), return_inverse=True)
+    days = (uniq_dates.astype("datetime64[D]") - EPOCH).astype(np.int32)
+    return days[codes]
+
+def convert_days_to_dates(days) -> np.ndarray:
+    """Convert integer days since epoch back into ISO date strings."""
+    uniq_days, codes = np.unique(np.asarray(days, dtype=np.int64), return_inverse=True)
+    dates = (EPOCH + uniq_days.astype("timedelta64[D]")).astype(str)
+    return dates[codes]
+
+def get_schema(data: pd.DataFrame, dictionary_cols: List[str]):
+    """Fetch the arrow schema of a table with int32 indices for its dictionary encoded columns.
+    Left to pandas, each chunk's index would be as narrow as its categories allow
+    (int8 up to 128), and parts with different widths cannot be read as one dataset.
+    """
+    import pyarrow as pa
+    schema = pa.Schema.from_pandas(data, preserve_index=False)
+    for col in dictionary_cols:
+        schema = schema.set(schema.get_field_index(col), pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+    return schema
+
+def write_subscribers(subscribers: pd.DataFrame, path: str) -> None:
+    """Write the subscribers table as a single parquet file with categorical attributes."""
+    dictionary_cols = ["gender", "ewallet_user_indicator"]
+    subscribers = subscribers.astype(dict.fromkeys(dictionary_cols, "category"))
+    subscribers.to_parquet(path, engine="pyarrow", index=False, schema=get_schema(subscribers, dictionary_cols))
+
+def read_subscribers(path: str, columns: List[str] = None, sub_uids: List[str] = None) -> pd.DataFrame:
+    filters = None if sub_uids is None else [("sub_uid", "in", list(sub_uids))]
+    return pd.read_parquet(path, engine="pyarrow", columns=columns, filters=filters)
+
+def write_cellsites(cellsites: pd.DataFrame, path: str) -> None:
+    """Write the cellsites table with lng/lat float columns in place of the WKT coords."""
+    lng, lat = get_cellsite_lnglat(cellsites)
+    cellsites = cellsites.drop(columns=["coords"], errors="ignore").assign(lng=lng, lat=lat)
+    cellsites.to_parquet(path, engine="pyarrow", index=False)
+
+def read_cellsites(path: str, columns: List[str] = None, with_wkt: bool = False) -> pd.DataFrame:
+    """Read the cellsites table, `with_wkt` rebuilds the WKT coords the processor functions expect."""
+    cellsites = pd.read_parquet(path, engine="pyarrow", columns=columns)
+    if with_wkt:
+        cellsites["coords"] = "POINT (" + cellsites.lng.astype(str) + " " + cellsites.lat.astype(str) + ")"
+    return cellsites
+
+def write_transactions(transactions: pd.DataFrame, path: str, part: int = 0) -> None:
+    """Write transactions as a parquet dataset partitioned by date.
+    Ids are dictionary encoded and dates are stored as integer days since epoch.
+    Each call writes its own `part`, so chunks and shards can be written separately,
+    all of them with the same schema.
+    """
+    transactions = transactions.assign(
+        transaction_day=convert_dates_to_days(transactions.transaction_dt),
+        transaction_hr=transactions.transaction_hr.astype(np.int8)
+    ).drop(columns=["transaction_dt"])
+    dictionary_cols = ["sub_uid", "cel_uid"]
+    transactions = transactions.astype(dict.fromkeys(dictionary_cols, "category"))
+    transactions.to_parquet(
+        path,
+        engine="pyarrow",
+        index=False,
+        schema=get_schema(transactions, dictionary_cols),
+        partition_cols=["transaction_day"],
+        basename_template=f"part-{str(part).zfill(5)}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+
+def read_transactions(
+    path: str, columns: List[str] = None, dates: List[str] = None, sub_uids: List[str] = None
+) -> pd.DataFrame:
+    """Read transactions, only touching the partitions of the given dates (if any)
+    and only decoding the given columns and subscribers (if any).
+    """
+    filters = []
+    if dates is not None:
+        filters.append(("transaction_day", "in", convert_dates_to_days(dates).tolist()))
+    if sub_uids is not None:
+        filters.append(("sub_uid", "in", list(sub_uids)))
+    read_columns = None
+    if columns is not None:
+        # the date is always read back from the partition key
+        read_columns = [c for c in columns if c != "transaction_dt"] + ["transaction_day"]
+    transactions = pd.read_parquet(
+        path, engine="pyarrow", columns=read_columns, filters=filters or None
+    )
+    transaction_day = transactions.pop("transaction_day").astype(np.int64)
+    transactions["transaction_dt"] = convert_days_to_dates(transaction_day)
+    if columns is None:
+        columns = [c for c in TRANSACTION_COLUMNS if c in transactions.columns]
+    return transactions[columns]
+
+def list_transaction_dates(path: str) -> List[str]:
+    """List the dates of a transactions dataset from its partitions, without reading any data."""
+    days = [int(d.split("=")[-1]) for d in os.listdir(path) if d.startswith("transaction_day=")]
+    return sorted(convert_days_to_dates(days).tolist())
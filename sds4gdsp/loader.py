@@ -1,19 +1,22 @@
 import random
 import numpy as np
-import osmnx as ox
-from shapely.geometry import (
-    Point, LineString, Polygon
-)
+from sds4gdsp.geometry import PointArray, LineArray, get_node_coords
+from sds4gdsp.profiler import profiled
+
+# osmnx, gadm and shapely are slow to import, and only the queries
+# below need the first two, so they are imported where used
+
+def make_point_array(num_points, lng_min, lng_max, lat_min, lat_max) -> PointArray:
+    lng = np.random.uniform(lng_min, lng_max, num_points)
+    lat = np.random.uniform(lat_min, lat_max, num_points)
+    return PointArray(lng, lat)
 
 def make_points(num_points, lng_min, lng_max, lat_min, lat_max):
-    coords = []
-    for _ in range(num_points):
-        lng = random.uniform(lng_min, lng_max)
-        lat = random.uniform(lat_min, lat_max)
-        coords.append((lng, lat))
-    return coords
+    points = make_point_array(num_points, lng_min, lng_max, lat_min, lat_max)
+    return list(zip(points.lng.tolist(), points.lat.tolist()))
 
 def make_lines(points):
+    from shapely.geometry import LineString
     random.shuffle(points)
     lines = []
     for orig, dest in zip(points, points[1:]):
@@ -22,21 +25,30 @@ def make_lines(points):
     return lines
 
 def make_polygon(points):
+    from shapely.geometry import Polygon
     return Polygon(points)
 
-def make_spatial_data(n):
+def make_spatial_data(n, as_arrays=False):
+    """Make n random points, the segments between consecutive points and their polygon.
+    With `as_arrays`, points and segments stay as coordinate arrays (see `sds4gdsp.geometry`)
+    instead of one shapely object each.
+    """
+    from shapely.geometry import Polygon
     coords = np.random.random((n, 2))
-    points = list(map(lambda z: Point(z), coords))
-    lines = LineString(points)
-    lines = list(map(lambda x: LineString(x), list(zip(points, points[1:]))))
-    polygon = Polygon(points)
-    return points, lines, polygon
+    points = PointArray.from_coords(coords)
+    lines = LineArray.from_path(points)
+    polygon = Polygon(coords)
+    if as_arrays:
+        return points, lines, polygon
+    return points.to_shapely(), lines.to_shapely(), polygon
 
+@profiled("graph_download")
 def make_graph(
-    origin, network_type, dist=500, dist_type="bbox", retain_all=False, simplify=True
+    origin, network_type, dist=500, dist_type="bbox", retain_all=False, simplify=True, cache=None
 ):
+    import osmnx as ox
     # query the road network using OSMNx
-    G = ox.graph_from_point(
+    query = lambda: ox.graph_from_point(
         center_point=origin, # origin point of query
         dist=dist, # radius in meters from the origin
         dist_type=dist_type, # examples is `bbox`
@@ -44,10 +56,49 @@ def make_graph(
         simplify=simplify, # simplify network topology
         network_type=network_type # filter to <insert type from OSM> roads
     )
-    return G
+    if cache is None:
+        return query()
+    params = dict(
+        origin=list(origin), network_type=network_type, dist=dist,
+        dist_type=dist_type, retain_all=retain_all, simplify=simplify
+    )
+    return cache.get_or_create("graph_from_point", params, query)
+
+@profiled("graph_download")
+def make_graph_from_polygon(
+    polygon, network_type, simplify=True, retain_all=False,
+    truncate_by_edge=True, clean_periphery=True, cache=None
+):
+    import osmnx as ox
+    # query the road network within the polygon using OSMNx
+    query = lambda: ox.graph_from_polygon(
+        polygon=polygon,
+        network_type=network_type,
+        simplify=simplify,
+        retain_all=retain_all,
+        truncate_by_edge=truncate_by_edge,
+        clean_periphery=clean_periphery
+    )
+    if cache is None:
+        return query()
+    params = dict(
+        polygon=polygon, network_type=network_type, simplify=simplify, retain_all=retain_all,
+        truncate_by_edge=truncate_by_edge, clean_periphery=clean_periphery
+    )
+    return cache.get_or_create("graph_from_polygon", params, query)
+
+@profiled("gadm_download")
+def make_boundaries(country_name, ad_level, version, cache=None):
+    from gadm import GADMDownloader
+    # download the administrative boundaries from GADM
+    query = lambda: GADMDownloader(version=str(version)).get_shape_data_by_country_name(
+        country_name=country_name, ad_level=ad_level
+    )
+    if cache is None:
+        return query()
+    params = dict(country_name=country_name, ad_level=ad_level, version=str(version))
+    return cache.get_or_create("gadm", params, query)
 
 def get_coord_sequence(G, route):
-    route_coords = []
-    for node in route:
-        route_coords.append((G.nodes[node]["x"], G.nodes[node]["y"]))
-    return route_coords
\ No newline at end of file
+    lng, lat = get_node_coords(G, route)
+    return list(zip(lng.tolist(), lat.tolist()))
\ No newline at end of file
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from sds4gdsp.processor import (
+    encode_cel_uids, get_cellsite_lnglat,
+    calc_haversine_distances, calc_reference_haversine_distances,
+    calc_elapsed_hours
+)
+from sds4gdsp.profiler import profiled
+
+def get_group_ids(offsets: np.ndarray) -> np.ndarray:
+    """Expand group offsets into the group id of every row."""
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def get_hop_mask(offsets: np.ndarray) -> np.ndarray:
+    """Flag the lag-1 hops (row i to row i+1) that stay within a group."""
+    num_rows = offsets[-1]
+    mask = np.ones(max(num_rows - 1, 0), dtype=bool)
+    # the last row of a group hops into the next group
+    boundaries = offsets[1:-1] - 1
+    mask[boundaries[(boundaries >= 0) & (boundaries < len(mask))]] = False
+    return mask
+
+def calc_group_travel_distances(offsets, lng, lat) -> np.ndarray:
+    """Compute for the total travel distance (in meters) of every group."""
+    group_ids = get_group_ids(offsets)
+    mask = get_hop_mask(offsets)
+    distances = calc_haversine_distances(lng[:-1][mask], lat[:-1][mask], lng[1:][mask], lat[1:][mask])
+    return np.bincount(group_ids[:-1][mask], weights=distances, minlength=len(offsets) - 1)
+
+def calc_group_network_travel_distances(offsets, cel_codes, table, lng, lat) -> np.ndarray:
+    """Compute for the total road network travel distance (in meters) of every group,
+    reading each hop from a precomputed cellsite distance table (see `sds4gdsp.network`).
+    Hops the table has no distance for (unreachable, or outside of the top k of a
+    sparse table) fall back to the haversine distance, so that a single one does
+    not turn the total into inf.
+    """
+    group_ids = get_group_ids(offsets)
+    mask = get_hop_mask(offsets)
+    distances = table.lookup(cel_codes[:-1][mask], cel_codes[1:][mask]).astype(np.float64)
+    is_missing = ~np.isfinite(distances)
+    if is_missing.any():
+        orig_lng, orig_lat = lng[:-1][mask][is_missing], lat[:-1][mask][is_missing]
+        dest_lng, dest_lat = lng[1:][mask][is_missing], lat[1:][mask][is_missing]
+        distances[is_missing] = calc_haversine_distances(orig_lng, orig_lat, dest_lng, dest_lat)
+    return np.bincount(group_ids[:-1][mask], weights=distances, minlength=len(offsets) - 1)
+
+def calc_group_radius_of_gyrations(offsets, lng, lat):
+    """Compute for the center of mass and radius of gyration (in meters) of every group."""
+    num_groups = len(offsets) - 1
+    group_ids = get_group_ids(offsets)
+    sizes = np.diff(offsets)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        com_lng = np.bincount(group_ids, weights=lng, minlength=num_groups) / sizes
+        com_lat = np.bincount(group_ids, weights=lat, minlength=num_groups) / sizes
+        distances = calc_reference_haversine_distances(lng, lat, com_lng[group_ids], com_lat[group_ids])
+        radius_of_gyrations = np.sqrt(np.bincount(group_ids, weights=distances ** 2, minlength=num_groups) / sizes)
+    return com_lng, com_lat, radius_of_gyrations
+
+def calc_group_activity_entropies(offsets, cel_codes, hrs, num_cels: int) -> np.ndarray:
+    """Compute for the activity entropy of every group, NaN for groups without a hop."""
+    num_groups = len(offsets) - 1
+    group_ids = get_group_ids(offsets)
+    mask = get_hop_mask(offsets)
+    hop_groups = group_ids[:-1][mask]
+    time_elapsed = calc_elapsed_hours(hrs[:-1][mask], hrs[1:][mask])
+    # hours spent per (group, origin site) pair, keyed on a single integer
+    keys = hop_groups.astype(np.int64) * num_cels + cel_codes[:-1][mask]
+    uniq_keys, inverse = np.unique(keys, return_inverse=True)
+    dwell_hrs = np.bincount(inverse, weights=time_elapsed, minlength=len(uniq_keys))
+    dwell_groups = uniq_keys // num_cels
+    total_hrs = np.bincount(dwell_groups, weights=dwell_hrs, minlength=num_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probas = dwell_hrs / total_hrs[dwell_groups]
+        terms = np.where(probas > 0, probas * np.log2(1 / probas), 0)
+    activity_entropies = np.bincount(dwell_groups, weights=terms, minlength=num_groups)
+    activity_entropies[total_hrs == 0] = np.nan
+    return activity_entropies
+
+def sort_transactions(transactions: pd.DataFrame, cellsites: pd.DataFrame, window: str = "month"):
+    """Sort transactions by (sub, date, hour) and delimit the groups for the given window.
+    Returns the sorted frame with cellsite codes and lng/lat attached plus the group offsets.
+    """
+    cel_codes = encode_cel_uids(transactions.cel_uid, cellsites)
+    # same as the inner merge with the cellsites table
+    transactions = transactions.loc[cel_codes >= 0]
+    cel_codes = cel_codes[cel_codes >= 0]
+    sub_codes, sub_uids = pd.factorize(transactions.sub_uid, sort=True)
+    dt_codes, dts = pd.factorize(transactions.transaction_dt, sort=True)
+    hrs = transactions.transaction_hr.to_numpy()
+    order = np.lexsort((hrs, dt_codes, sub_codes))
+    if window == "month":
+        # ISO date strings, the month key is the first day of the month
+        periods = pd.Index(dts.astype(str).str[:7] + "-01")
+        period_codes, periods = pd.factorize(periods[dt_codes], sort=True)
+    elif window == "day":
+        period_codes, periods = dt_codes, pd.Index(dts.astype(str))
+    else:
+        raise ValueError(f"unknown window '{window}', expected 'month' or 'day'")
+    sub_codes, period_codes = sub_codes[order], period_codes[order]
+    is_start = np.ones(len(order), dtype=bool)
+    is_start[1:] = (sub_codes[1:] != sub_codes[:-1]) | (period_codes[1:] != period_codes[:-1])
+    offsets = np.append(np.flatnonzero(is_start), len(order))
+    lng, lat = get_cellsite_lnglat(cellsites)
+    cel_codes = cel_codes[order]
+    sorted_transactions = transactions.iloc[order].reset_index(drop=True).assign(
+        cel_code=cel_codes, lng=lng[cel_codes], lat=lat[cel_codes]
+    )
+    groups = pd.DataFrame(dict(
+        sub_uid=sub_uids[sub_codes[offsets[:-1]]],
+        transaction_dt=periods[period_codes[offsets[:-1]]]
+    ))
+    return sorted_transactions, offsets, groups
+
+def calc_group_mobility_indices(offsets, lng, lat, cel_codes, hrs, num_cels: int, network_table=None) -> dict:
+    """Compute for the total travel distance, radius of gyration and activity entropy
+    of every group of rows already sorted by (sub, date, hour).
+    """
+    if network_table is None:
+        total_travel_distances = calc_group_travel_distances(offsets, lng, lat)
+    else:
+        total_travel_distances = calc_group_network_travel_distances(offsets, cel_codes, network_table, lng, lat)
+    return dict(
+        total_travel_distance=total_travel_distances,
+        radius_of_gyration=calc_group_radius_of_gyrations(offsets, lng, lat)[-1],
+        activity_entropy=calc_group_activity_entropies(offsets, cel_codes, hrs, num_cels)
+    )
+
+@profiled("mobility_indices", rows_arg=0)
+def calc_mobility_indices(
+    transactions: pd.DataFrame, cellsites: pd.DataFrame, window: str = "month", network_table=None
+) -> pd.DataFrame:
+    """Compute for the total travel distance, radius of gyration and activity entropy
+    of every subscriber per month (or per day) in one pass over the transactions.
+    With a `network_table`, the travel distance follows the road network instead
+    of the straight line between cellsites (except for the hops it has no
+    distance for, see `calc_group_network_travel_distances`).
+    """
+    sorted_transactions, offsets, groups = sort_transactions(transactions, cellsites, window)
+    lng = sorted_transactions.lng.to_numpy()
+    lat = sorted_transactions.lat.to_numpy()
+    cel_codes = sorted_transactions.cel_code.to_numpy()
+    hrs = sorted_transactions.transaction_hr.to_numpy()
+    indices = calc_group_mobility_indices(offsets, lng, lat, cel_codes, hrs, len(cellsites), network_table)
+    for metric, values in indices.items():
+        groups[metric] = values
+    return groups
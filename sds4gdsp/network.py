@@ -0,0 +1,210 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+from typing import TYPE_CHECKING
+from sds4gdsp.indexer import CellsiteIndex
+
+if TYPE_CHECKING:
+    from networkx import Graph
+
+def get_graph_arrays(G: "Graph"):
+    """Fetch the node ids, node lng/lat and a CSR adjacency matrix weighted by edge length.
+    Parallel edges keep the shortest length.
+    """
+    nodes = np.array(list(G.nodes))
+    num_nodes = len(nodes)
+    positions = {node: i for i, node in enumerate(nodes.tolist())}
+    lng = np.array([x for _, x in G.nodes(data="x")], dtype=np.float64)
+    lat = np.array([y for _, y in G.nodes(data="y")], dtype=np.float64)
+    edges = np.array(
+        [(positions[u], positions[v], length) for u, v, length in G.edges(data="length", default=np.inf)],
+        dtype=np.float64
+    ).reshape(-1, 3)
+    keys = edges[:, 0].astype(np.int64) * num_nodes + edges[:, 1].astype(np.int64)
+    length = edges[:, 2]
+    # keep the shortest of the parallel edges, the first per key once sorted
+    order = np.lexsort((length, keys))
+    keys, length = keys[order], length[order]
+    is_first = np.ones(len(keys), dtype=bool)
+    is_first[1:] = keys[1:] != keys[:-1]
+    keys, length = keys[is_first], length[is_first]
+    adjacency = sparse.csr_matrix(
+        (length, (keys // num_nodes, keys % num_nodes)), shape=(num_nodes, num_nodes)
+    )
+    return nodes, lng, lat, adjacency
+
+def snap_to_nodes(node_lng, node_lat, lng, lat) -> np.ndarray:
+    """Fetch the position of the nearest graph node of each point."""
+    _, idx = CellsiteIndex(node_lng, node_lat).query_knn(lng, lat, k=1)
+    return idx[:, 0]
+
+def get_route_predecessors(node_predecessors: np.ndarray, dest_nodes: np.ndarray):
+    """Collect the (source row, node, predecessor) entries on the shortest paths to
+    `dest_nodes` only, row i of `dest_nodes` holds the destinations kept for source i.
+    The paths are walked back one step at a time for all of them at once.
+    """
+    num_nodes = node_predecessors.shape[1]
+    rows = np.repeat(np.arange(dest_nodes.shape[0]), dest_nodes.shape[1])
+    nodes = dest_nodes.ravel()
+    seen = np.empty(0, dtype=np.int64)
+    entries = []
+    while len(nodes):
+        preds = node_predecessors[rows, nodes]
+        # the source itself and unreachable nodes have no predecessor (negative)
+        keys, idx = np.unique(rows.astype(np.int64) * num_nodes + nodes, return_index=True)
+        is_new = (preds[idx] >= 0) & ~np.isin(keys, seen)
+        rows, nodes, preds = rows[idx][is_new], nodes[idx][is_new], preds[idx][is_new]
+        seen = np.union1d(seen, keys[is_new])
+        entries.append((rows, nodes, preds))
+        nodes = preds
+    return tuple(map(np.concatenate, zip(*entries))) if entries else (np.empty(0, dtype=np.int64),) * 3
+
+class NetworkDistanceTable:
+    """Cellsite to cellsite shortest path distances (in meters) over the road network.
+
+    Each cellsite is snapped once to its nearest graph node, then multi-source
+    Dijkstra runs in batches of sources. Small towns keep the full table as dense
+    float32, large ones only keep the `top_k` nearest destinations per cellsite as
+    a sparse matrix (missing pairs read as inf). With `with_routes`, the shortest
+    path predecessors are kept so that route geometries are table reads as well:
+    a dense num_cels x num_nodes int32 matrix for dense tables, and for sparse ones
+    only the entries on the paths to the kept destinations (stored plus one, so
+    that a missing entry reads as -1).
+    """
+
+    def __init__(self, distances, cel_nodes, node_ids, node_lng, node_lat, predecessors=None):
+        self.distances = distances
+        self.cel_nodes = cel_nodes
+        self.node_ids = node_ids
+        self.node_lng = node_lng
+        self.node_lat = node_lat
+        self.predecessors = predecessors
+
+    @property
+    def is_dense(self) -> bool:
+        return isinstance(self.distances, np.ndarray)
+
+    @classmethod
+    def build(
+        cls, G: "Graph", cel_lng, cel_lat, top_k: int = None, max_dense_cels: int = 5_000,
+        with_routes: bool = False, batch_size: int = 256
+    ):
+        node_ids, node_lng, node_lat, adjacency = get_graph_arrays(G)
+        cel_nodes = snap_to_nodes(node_lng, node_lat, cel_lng, cel_lat)
+        num_cels = len(cel_nodes)
+        is_dense = top_k is None and num_cels <= max_dense_cels
+        if not is_dense:
+            top_k = min(top_k or 50, num_cels)
+        dense_rows, sparse_rows, predecessors = [], [], []
+        for start in range(0, num_cels, batch_size):
+            sources = cel_nodes[start:start+batch_size]
+            result = dijkstra(adjacency, directed=True, indices=sources, return_predecessors=with_routes)
+            node_distances, node_predecessors = result if with_routes else (result, None)
+            block = node_distances[:, cel_nodes].astype(np.float32)
+            if is_dense:
+                dense_rows.append(block)
+                if with_routes:
+                    predecessors.append(node_predecessors.astype(np.int32))
+            else:
+                # keep the k nearest destinations of every source
+                cols = np.argpartition(block, top_k - 1, axis=1)[:, :top_k]
+                values = np.take_along_axis(block, cols, axis=1)
+                rows = np.repeat(np.arange(start, start + len(sources)), top_k)
+                finite = np.isfinite(values.ravel())
+                sparse_rows.append((values.ravel()[finite], rows[finite], cols.ravel()[finite]))
+                if with_routes:
+                    pred_rows, pred_nodes, preds = get_route_predecessors(node_predecessors, cel_nodes[cols])
+                    predecessors.append((preds + 1, pred_rows + start, pred_nodes))
+        if is_dense:
+            distances = np.vstack(dense_rows) if dense_rows else np.empty((0, 0), dtype=np.float32)
+        else:
+            values, rows, cols = map(np.concatenate, zip(*sparse_rows))
+            distances = sparse.csr_matrix((values, (rows, cols)), shape=(num_cels, num_cels))
+        if not with_routes:
+            predecessors = None
+        elif is_dense:
+            predecessors = np.vstack(predecessors)
+        else:
+            preds, rows, nodes = map(np.concatenate, zip(*predecessors))
+            predecessors = sparse.csr_matrix(
+                (preds.astype(np.int32), (rows, nodes)), shape=(num_cels, len(node_ids))
+            )
+        return cls(distances, cel_nodes, node_ids, node_lng, node_lat, predecessors)
+
+    def lookup(self, orig_codes, dest_codes) -> np.ndarray:
+        """Read the network distances of (orig, dest) cellsite code pairs."""
+        orig_codes, dest_codes = np.asarray(orig_codes), np.asarray(dest_codes)
+        if self.is_dense:
+            return self.distances[orig_codes, dest_codes]
+        values = np.asarray(self.distances[orig_codes, dest_codes]).ravel().astype(np.float32)
+        # pairs outside of the top k read as zero, only the same node is truly zero apart
+        same_node = self.cel_nodes[orig_codes] == self.cel_nodes[dest_codes]
+        return np.where((values > 0) | same_node, values, np.inf)
+
+    def get_route_positions(self, orig_code: int, dest_code: int) -> np.ndarray:
+        """Follow the predecessors of the shortest path between two cellsites, returns the
+        positions of its nodes (in `node_ids`), empty if unreachable (or, for sparse
+        tables, outside of the top k of the origin).
+        """
+        if self.predecessors is None:
+            raise ValueError("routes were not kept, build the table with `with_routes=True`")
+        orig_node, node = self.cel_nodes[orig_code], self.cel_nodes[dest_code]
+        path = [node]
+        while node != orig_node:
+            if isinstance(self.predecessors, np.ndarray):
+                node = self.predecessors[orig_code, node]
+            else:
+                node = int(self.predecessors[orig_code, node]) - 1
+            if node < 0:
+                return np.empty(0, dtype=np.int64) # unreachable
+            path.append(node)
+        return np.array(path[::-1], dtype=np.int64)
+
+    def get_route(self, orig_code: int, dest_code: int) -> list:
+        """Fetch the graph node ids of the shortest path between two cellsites."""
+        return self.node_ids[self.get_route_positions(orig_code, dest_code)].tolist()
+
+    def get_route_coords(self, orig_code: int, dest_code: int) -> list:
+        """Fetch the lng/lat sequence of the shortest path between two cellsites."""
+        path = self.get_route_positions(orig_code, dest_code)
+        return list(zip(self.node_lng[path].tolist(), self.node_lat[path].tolist()))
+
+    def save(self, path: str) -> None:
+        """Persist the table to an npz file."""
+        arrays = dict(
+            cel_nodes=self.cel_nodes, node_ids=self.node_ids,
+            node_lng=self.node_lng, node_lat=self.node_lat
+        )
+        if self.is_dense:
+            arrays["distances"] = self.distances
+        else:
+            csr = self.distances.tocsr()
+            arrays.update(data=csr.data, indices=csr.indices, indptr=csr.indptr, shape=np.array(csr.shape))
+        if isinstance(self.predecessors, np.ndarray):
+            arrays["predecessors"] = self.predecessors
+        elif self.predecessors is not None:
+            csr = self.predecessors.tocsr()
+            arrays.update(pred_data=csr.data, pred_indices=csr.indices, pred_indptr=csr.indptr)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as table:
+            if "distances" in table:
+                distances = table["distances"]
+            else:
+                distances = sparse.csr_matrix(
+                    (table["data"], table["indices"], table["indptr"]), shape=tuple(table["shape"])
+                )
+            predecessors = None
+            if "predecessors" in table:
+                predecessors = table["predecessors"]
+            elif "pred_data" in table:
+                predecessors = sparse.csr_matrix(
+                    (table["pred_data"], table["pred_indices"], table["pred_indptr"]),
+                    shape=(len(table["cel_nodes"]), len(table["node_ids"]))
+                )
+            return cls(
+                distances, table["cel_nodes"], table["node_ids"],
+                table["node_lng"], table["node_lat"], predecessors
+            )
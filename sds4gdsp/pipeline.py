@@ -0,0 +1,269 @@
+import os
+import gzip
+import json
+import time
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+from functools import partial
+from typing import Callable, Dict, List, Sequence
+from omegaconf import DictConfig, OmegaConf
+from sds4gdsp.cache import GeoCache
+from sds4gdsp.profiler import span
+from sds4gdsp.sharding import (
+    get_shard_bounds, get_shard_rng, get_part_filepaths,
+    read_csv_parts, write_shard, run_shards
+)
+
+MANIFEST = "manifest.json"
+
+class Stage:
+    """A step of the pipeline that writes its artifacts into its own directory.
+
+    `func(cfg, inputs, dirpath)` gets the artifact directories of its upstream stages
+    by name, and `get_params(cfg)` picks the config values its output depends on
+    (filepaths and worker counts excluded), which key the artifacts together with
+    the keys of the upstream stages. Bump `version` when `func` changes its output.
+    """
+
+    def __init__(self, name: str, func: Callable, get_params: Callable, deps: Sequence[str] = (), version: int = 1):
+        self.name = name
+        self.func = func
+        self.get_params = get_params
+        self.deps = list(deps)
+        self.version = version
+
+class Pipeline:
+    """Runs stages in dependency order, skipping those whose artifacts already exist.
+
+    Artifacts live in `{dirpath}/{stage}-{key}/`, so changing a parameter only
+    reruns the stages downstream of it, and going back to a previous value (e.g.
+    across a sweep) reuses the artifacts already there.
+    """
+
+    def __init__(self, stages: List[Stage], dirpath: str):
+        self.stages = {stage.name: stage for stage in stages}
+        self.dirpath = dirpath
+
+    def get_order(self, targets: Sequence[str] = None) -> List[str]:
+        """Topologically sort the targets (all stages by default) and their upstream stages."""
+        order, visiting = [], set()
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"stage '{name}' depends on itself")
+            if name not in self.stages:
+                raise KeyError(f"unknown stage '{name}', expected one of {list(self.stages)}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+        for name in targets or list(self.stages):
+            visit(name)
+        return order
+
+    def get_keys(self, cfg: DictConfig, targets: Sequence[str] = None) -> Dict[str, str]:
+        keys = {}
+        for name in self.get_order(targets):
+            stage = self.stages[name]
+            keys[name] = GeoCache.make_key(name, dict(
+                version=stage.version,
+                params=stage.get_params(cfg),
+                upstream={dep: keys[dep] for dep in stage.deps}
+            ))
+        return keys
+
+    def get_stage_dirpath(self, key: str) -> str:
+        return os.path.join(self.dirpath, key)
+
+    def is_done(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.get_stage_dirpath(key), MANIFEST))
+
+    def run(self, cfg: DictConfig, targets: Sequence[str] = None, force: Sequence[str] = ()) -> Dict[str, str]:
+        """Run the stages that are not done yet (or forced), returns the artifact directory of each stage."""
+        keys = self.get_keys(cfg, targets)
+        dirpaths = {}
+        for name, key in keys.items():
+            stage = self.stages[name]
+            dirpath = self.get_stage_dirpath(key)
+            dirpaths[name] = dirpath
+            if self.is_done(key) and name not in force:
+                print(f"SKIP. '{name}' is up to date in '{dirpath}'")
+                continue
+            # write then rename so a failed stage never looks done
+            tmp_dirpath = f"{dirpath}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+            os.makedirs(tmp_dirpath)
+            start = time.perf_counter()
+            with span(name):
+                stage.func(cfg, {dep: dirpaths[dep] for dep in stage.deps}, tmp_dirpath)
+            with open(os.path.join(tmp_dirpath, MANIFEST), "w") as f:
+                json.dump(dict(
+                    stage=name, key=key, version=stage.version,
+                    params=stage.get_params(cfg),
+                    upstream={dep: keys[dep] for dep in stage.deps},
+                    seconds=time.perf_counter() - start
+                ), f, indent=2)
+            shutil.rmtree(dirpath, ignore_errors=True)
+            os.replace(tmp_dirpath, dirpath)
+            print(f"OK. '{name}' saved in '{dirpath}'")
+        return dirpaths
+
+def to_container(cfg_section) -> dict:
+    return OmegaConf.to_container(cfg_section, resolve=True)
+
+def make_geocache(cfg: DictConfig) -> GeoCache:
+    return GeoCache(dirpath=cfg.cache.dirpath, max_bytes=cfg.cache.max_bytes, offline=cfg.cache.offline)
+
+def save_pickle(obj, filepath: str) -> None:
+    with gzip.open(filepath, "wb", compresslevel=6) as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_pickle(filepath: str):
+    with gzip.open(filepath, "rb") as f:
+        return pickle.load(f)
+
+# the stages below mirror the scripts, see scripts/make_fake_*.py for the details
+
+def get_boundary_params(cfg: DictConfig) -> dict:
+    return dict(
+        country_name="Philippines",
+        ad_level=cfg.fake_cellsites.ad_level,
+        gadm_version=str(cfg.fake_cellsites.gadm_version),
+        town_keyword=cfg.fake_cellsites.town_keyword
+    )
+
+def run_boundary(cfg: DictConfig, inputs: dict, dirpath: str) -> None:
+    from sds4gdsp.loader import make_boundaries
+    params = get_boundary_params(cfg)
+    gadm = make_boundaries(params["country_name"], params["ad_level"], params["gadm_version"], cache=make_geocache(cfg))
+    polygon = gadm.loc[gadm.NAME_2==params["town_keyword"]].geometry.item()
+    with open(os.path.join(dirpath, "boundary.wkt"), "w") as f:
+        f.write(polygon.wkt)
+
+def load_boundary(dirpath: str):
+    from shapely import wkt
+    with open(os.path.join(dirpath, "boundary.wkt")) as f:
+        return wkt.loads(f.read())
+
+def get_graph_params(cfg: DictConfig) -> dict:
+    return dict(
+        network_type="drive", simplify=True, retain_all=False,
+        truncate_by_edge=True, clean_periphery=True
+    )
+
+def run_graph(cfg: DictConfig, inputs: dict, dirpath: str) -> None:
+    from sds4gdsp.loader import make_graph_from_polygon
+    G = make_graph_from_polygon(
+        polygon=load_boundary(inputs["boundary"]), cache=make_geocache(cfg), **get_graph_params(cfg)
+    )
+    save_pickle(G, os.path.join(dirpath, "graph.pkl.gz"))
+
+def load_graph(dirpath: str):
+    return load_pickle(os.path.join(dirpath, "graph.pkl.gz"))
+
+def get_cellsites_params(cfg: DictConfig) -> dict:
+    return dict(seed=cfg.seed, min_distance=cfg.fake_cellsites.min_distance)
+
+def run_cellsites(cfg: DictConfig, inputs: dict, dirpath: str) -> None:
+    from sds4gdsp.generator import make_cellsites
+    params = get_cellsites_params(cfg)
+    G = load_graph(inputs["graph"])
+    cellsites = make_cellsites(G, params["min_distance"], np.random.default_rng(params["seed"]))
+    cellsites.to_csv(os.path.join(dirpath, "cellsites.csv"), index=False)
+
+def get_knn_params(cfg: DictConfig) -> dict:
+    return dict(k_nearest_neighbor=cfg.fake_transactions.k_nearest_neighbor)
+
+def run_knn(cfg: DictConfig, inputs: dict, dirpath: str) -> None:
+    from sds4gdsp.generator import make_neighbors
+    cellsites = pd.read_csv(os.path.join(inputs["cellsites"], "cellsites.csv"))
+    neighbors = make_neighbors(cellsites, cfg.fake_transactions.k_nearest_neighbor)
+    np.save(os.path.join(dirpath, "neighbors.npy"), neighbors)
+
+def get_subscribers_params(cfg: DictConfig) -> dict:
+    params = to_container(cfg.fake_subscribers)
+    params.pop("filepath_subscribers")
+    return dict(seed=cfg.seed, num_shards=cfg.sharding.num_shards, **params)
+
+def run_subscribers(cfg: DictConfig, inputs: dict, dirpath: str) -> None:
+    from sds4gdsp.generator import make_subscribers
+    params = get_subscribers_params(cfg)
+    num_shards = params["num_shards"]
+    filepath = os.path.join(dirpath, "subscribers.csv")
+    tasks = []
+    for shard_id, (start, stop) in enumerate(get_shard_bounds(params["num_subs"], num_shards)):
+        tasks.append(partial(
+            write_shard, make_subscribers, filepath, shard_id, num_shards,
+            start=start, stop=stop, min_age=params["min_age"], max_age=params["max_age"],
+            rng=get_shard_rng(params["seed"], shard_id, "subscribers"),
+            batch_size=params["batch_size"],
+            name_pool_size=params["name_pool_size"]
+        ))
+    run_shards(tasks, cfg.sharding.num_workers)
+
+def get_transactions_params(cfg: DictConfig) -> dict:
+    params = to_container(cfg.fake_transactions)
+    # the neighbors come from the knn stage
+    params.pop("filepath_transactions")
+    params.pop("k_nearest_neighbor")
+    return dict(seed=cfg.seed, num_shards=cfg.sharding.num_shards, **params)
+
+def run_transactions(cfg: DictConfig, inputs: dict, dirpath: str) -> None:
+    from sds4gdsp.generator import make_transactions
+    params = get_transactions_params(cfg)
+    num_shards = params["num_shards"]
+    sub_uids = read_csv_parts(os.path.join(inputs["subscribers"], "subscribers.csv"), num_shards).sub_uid.to_numpy()
+    cellsites = pd.read_csv(os.path.join(inputs["cellsites"], "cellsites.csv"))
+    neighbors = np.load(os.path.join(inputs["knn"], "neighbors.npy"))
+    filepath = os.path.join(dirpath, "transactions.csv")
+    tasks = []
+    for shard_id, (start, stop) in enumerate(get_shard_bounds(len(sub_uids), num_shards)):
+        txn_prefix = "glo-txn-" if num_shards==1 else f"glo-txn-{str(shard_id+1).zfill(3)}-"
+        tasks.append(partial(
+            write_shard, make_transactions, filepath, shard_id, num_shards,
+            sub_uids=sub_uids[start:stop],
+            cel_uids=cellsites.cel_uid.to_numpy(),
+            neighbors=neighbors,
+            start_date=params["start_date"],
+            num_days=params["num_days"],
+            cap_start_hr=params["cap_start_hr"],
+            rng=get_shard_rng(params["seed"], shard_id, "transactions"),
+            batch_size=params["batch_size"],
+            txn_prefix=txn_prefix
+        ))
+    run_shards(tasks, cfg.sharding.num_workers)
+
+STAGES = [
+    Stage("boundary", run_boundary, get_boundary_params),
+    Stage("graph", run_graph, get_graph_params, deps=["boundary"]),
+    Stage("cellsites", run_cellsites, get_cellsites_params, deps=["graph"]),
+    Stage("knn", run_knn, get_knn_params, deps=["cellsites"]),
+    Stage("subscribers", run_subscribers, get_subscribers_params, version=2),
+    Stage("transactions", run_transactions, get_transactions_params, deps=["subscribers", "cellsites", "knn"], version=2)
+]
+
+def make_pipeline(dirpath: str) -> Pipeline:
+    return Pipeline(STAGES, dirpath)
+
+def publish(cfg: DictConfig, dirpaths: Dict[str, str]) -> None:
+    """Copy the datasets of the pipeline to the filepaths in the config, where the notebooks read them."""
+    num_shards = cfg.sharding.num_shards
+    outputs = dict(
+        subscribers=("subscribers.csv", cfg.fake_subscribers.filepath_subscribers, num_shards),
+        cellsites=("cellsites.csv", cfg.fake_cellsites.filepath_cellsites, 1),
+        transactions=("transactions.csv", cfg.fake_transactions.filepath_transactions, num_shards)
+    )
+    for name, (filename, filepath, num_parts) in outputs.items():
+        if name not in dirpaths:
+            continue
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        for src, dst in zip(
+            get_part_filepaths(os.path.join(dirpaths[name], filename), num_parts),
+            get_part_filepaths(filepath, num_parts)
+        ):
+            shutil.copyfile(src, dst)
+        print(f"OK. Successfully saved '{filepath}' ({num_parts} part/s)")
@@ -1,18 +1,30 @@
 import os
 import shapely
+import matplotlib
+import numpy as np
+import pandas as pd
 import geopandas as gpd
 import matplotlib.pyplot as plt
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from sds4gdsp.processor import fetch_total_travel_distance
+from sds4gdsp.mobility import sort_transactions, get_hop_mask
 
-def get_route_fig(r):
-    fig, ax = plt.subplots(1, 1)
+def draw_route(ax, r):
     gpd.GeoSeries(r).plot(ax=ax, linewidth=5, zorder=1)
     orig = shapely.geometry.Point([r.xy[0][0], r.xy[1][0]])
     dest = shapely.geometry.Point([r.xy[0][-1], r.xy[1][-1]])
     gpd.GeoSeries(orig).plot(ax=ax, color="red", markersize=250, zorder=2, alpha=0.8)
     gpd.GeoSeries(dest).plot(ax=ax, color="green", markersize=250, zorder=2, alpha=0.8)
-    plt.axis("off")
+    ax.axis("off")
     ax.ticklabel_format(useOffset=False)
+
+def get_route_fig(r):
+    fig, ax = plt.subplots(1, 1)
+    draw_route(ax, r)
     plt.close()
     return fig
 
@@ -37,6 +49,180 @@ def plot_images(imgs, nrows=5, ncols=6, figsize=(10, 10)):
     plt.show()
     return fig
 
+def init_render_worker():
+    # workers never show figures, the Agg backend only draws to files
+    matplotlib.use("Agg")
+
+def render_route(task):
+    """Render a single route (coords, filepath, thumbnail filepath, thumbnail size, dpi) to disk."""
+    coords, filepath, thumbnail_filepath, thumbnail_size, dpi = task
+    # a figure on its own Agg canvas, outside of pyplot and whatever backend it uses
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    draw_route(fig.add_subplot(1, 1, 1), shapely.geometry.LineString(coords))
+    fig.savefig(filepath, dpi=dpi)
+    with Image.open(filepath) as img:
+        img.thumbnail(thumbnail_size)
+        img.convert("RGB").save(thumbnail_filepath)
+    return filepath
+
+def render_routes(
+    routes, dirpath, num_workers=None, extension=".jpg", thumbnail_size=(128, 128), dpi=72, chunksize=16
+):
+    """Render many routes to `dirpath` (thumbnails to `dirpath/thumbnails`) in worker processes.
+    Routes are LineStrings or lng/lat sequences, only their coords are sent to the workers.
+    """
+    thumbnail_dirpath = os.path.join(dirpath, "thumbnails")
+    os.makedirs(thumbnail_dirpath, exist_ok=True)
+    width = len(str(max(len(routes), 1)))
+    tasks = []
+    for i, r in enumerate(routes):
+        coords = list(r.coords) if hasattr(r, "coords") else list(r)
+        f = f"route-{str(i).zfill(width)}{extension}"
+        tasks.append((coords, os.path.join(dirpath, f), os.path.join(thumbnail_dirpath, f), thumbnail_size, dpi))
+    if num_workers == 1:
+        return list(map(render_route, tasks))
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=init_render_worker) as executor:
+        return list(executor.map(render_route, tasks, chunksize=chunksize))
+
+def make_contact_sheet(filepaths, filepath, ncols=10, thumbnail_size=(128, 128), background="white"):
+    """Compose images into a single grid image, opening one image at a time."""
+    nrows = max(1, -(-len(filepaths) // ncols))
+    w, h = thumbnail_size
+    sheet = Image.new("RGB", (ncols * w, nrows * h), background)
+    for i, f in enumerate(filepaths):
+        with Image.open(f) as img:
+            img.thumbnail(thumbnail_size)
+            sheet.paste(img.convert("RGB"), ((i % ncols) * w, (i // ncols) * h))
+    sheet.save(filepath)
+    return filepath
+
+def list_images(dirpath, extension=".jpg"):
+    """List the image filepaths of a directory without opening any of them."""
+    return [os.path.join(dirpath, f) for f in sorted(os.listdir(dirpath)) if f.endswith(extension)]
+
+def plot_image_page(filepaths, page=0, nrows=5, ncols=6, figsize=(10, 10)):
+    """Plot a single page of a gallery, only the images of that page are opened."""
+    page_size = nrows * ncols
+    page_filepaths = filepaths[page*page_size:(page+1)*page_size]
+    fig, axes = plt.subplots(nrows=nrows, ncols=ncols, figsize=figsize)
+    for ax, f in zip(axes.flat, page_filepaths):
+        with Image.open(f) as img:
+            # downscale on load, a page cell never needs the full resolution
+            img.draft("RGB", (figsize[0] * 100 // ncols, figsize[1] * 100 // nrows))
+            ax.imshow(img.copy())
+    for ax in axes.flat:
+        ax.axis("off")
+    plt.tight_layout()
+    plt.close()
+    return fig
+
+def get_raster_bounds(lng, lat, pad=0.02):
+    """Fetch (lng_min, lng_max, lat_min, lat_max) covering the points, padded by a fraction."""
+    lng_min, lng_max, lat_min, lat_max = np.min(lng), np.max(lng), np.min(lat), np.max(lat)
+    lng_pad = max(lng_max - lng_min, 1e-6) * pad
+    lat_pad = max(lat_max - lat_min, 1e-6) * pad
+    return lng_min - lng_pad, lng_max + lng_pad, lat_min - lat_pad, lat_max + lat_pad
+
+def convert_lnglat_to_pixels(lng, lat, bounds, shape):
+    """Convert lng/lat into fractional (col, row) pixel coords, row 0 being the top."""
+    lng_min, lng_max, lat_min, lat_max = bounds
+    nrows, ncols = shape
+    cols = (np.asarray(lng) - lng_min) / (lng_max - lng_min) * ncols
+    rows = (lat_max - np.asarray(lat)) / (lat_max - lat_min) * nrows
+    return cols, rows
+
+def accumulate_pixels(raster, cols, rows, weights=None):
+    """Add (weighted) counts to the raster, pixels outside of it are dropped."""
+    nrows, ncols = raster.shape
+    cols, rows = np.floor(cols).astype(np.int64), np.floor(rows).astype(np.int64)
+    inside = (cols >= 0) & (cols < ncols) & (rows >= 0) & (rows < nrows)
+    weights = None if weights is None else np.asarray(weights)[inside]
+    raster += np.bincount(rows[inside] * ncols + cols[inside], weights=weights, minlength=raster.size).reshape(raster.shape)
+    return raster
+
+def rasterize_points(lng, lat, bounds, shape=(512, 512), weights=None):
+    """Bin points into a 2d raster of (weighted) counts per pixel."""
+    raster = np.zeros(shape, dtype=np.float64)
+    cols, rows = convert_lnglat_to_pixels(lng, lat, bounds, shape)
+    return accumulate_pixels(raster, cols, rows, weights)
+
+def get_sample_chunks(num_samples: np.ndarray, chunksize: int) -> np.ndarray:
+    """Fetch the segment bounds of chunks that hold about `chunksize` samples each,
+    a segment with more samples than that makes a chunk of its own.
+    """
+    cum_samples = np.cumsum(num_samples)
+    num_chunks = int(np.ceil(cum_samples[-1] / chunksize)) if len(cum_samples) else 0
+    stops = np.searchsorted(cum_samples, np.arange(1, num_chunks) * chunksize, side="right")
+    return np.unique(np.concatenate([[0], stops, [len(num_samples)]]))
+
+def rasterize_segments(lng1, lat1, lng2, lat2, bounds, shape=(512, 512), weights=None, chunksize=1_000_000):
+    """Draw straight segments into a 2d raster, counting each segment once per pixel it crosses.
+    Cost is linear in the number of pixels drawn, never in the number of geometries, and
+    segments are drawn about `chunksize` samples (pixel steps) at a time to bound memory.
+    """
+    raster = np.zeros(shape, dtype=np.float64)
+    cols1, rows1 = convert_lnglat_to_pixels(lng1, lat1, bounds, shape)
+    cols2, rows2 = convert_lnglat_to_pixels(lng2, lat2, bounds, shape)
+    weights = np.ones(len(cols1)) if weights is None else np.asarray(weights, dtype=np.float64)
+    # one sample per pixel step along the longer axis of the segment
+    all_samples = np.ceil(np.maximum(np.abs(cols2 - cols1), np.abs(rows2 - rows1))).astype(np.int64) + 1
+    chunk_bounds = get_sample_chunks(all_samples, chunksize)
+    for start, stop in zip(chunk_bounds[:-1].tolist(), chunk_bounds[1:].tolist()):
+        c1, r1, c2, r2 = cols1[start:stop], rows1[start:stop], cols2[start:stop], rows2[start:stop]
+        num_samples = all_samples[start:stop]
+        seg_ids = np.repeat(np.arange(len(c1)), num_samples)
+        offsets = np.cumsum(num_samples) - num_samples
+        t = (np.arange(num_samples.sum()) - offsets[seg_ids]) / np.maximum(num_samples - 1, 1)[seg_ids]
+        cols = np.floor(c1[seg_ids] + t * (c2 - c1)[seg_ids])
+        rows = np.floor(r1[seg_ids] + t * (r2 - r1)[seg_ids])
+        # a segment adds to a pixel once even if several samples land in it
+        is_new = np.ones(len(seg_ids), dtype=bool)
+        is_new[1:] = (seg_ids[1:] != seg_ids[:-1]) | (cols[1:] != cols[:-1]) | (rows[1:] != rows[:-1])
+        accumulate_pixels(raster, cols[is_new], rows[is_new], weights[start:stop][seg_ids[is_new]])
+    return raster
+
+def plot_raster(raster, bounds, ax=None, cmap="magma", log=True, figsize=(8, 8), title=None):
+    if ax is None:
+        fig, ax = plt.subplots(1, 1, figsize=figsize)
+    else:
+        fig = ax.figure
+    norm = LogNorm(vmin=1, vmax=max(raster.max(), 1)) if log else None
+    ax.imshow(np.ma.masked_less_equal(raster, 0), extent=bounds, origin="upper", cmap=cmap, norm=norm, interpolation="nearest")
+    ax.set_facecolor("black")
+    ax.ticklabel_format(useOffset=False)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    if title:
+        ax.set_title(title)
+    plt.close()
+    return fig
+
+def plot_transaction_density(transactions, cellsites, hours=None, shape=(512, 512), bounds=None, **kwargs):
+    """Plot the number of transactions per pixel, optionally for the given hours of the day only."""
+    sorted_transactions, _, _ = sort_transactions(transactions, cellsites, window="month")
+    if hours is not None:
+        sorted_transactions = sorted_transactions.loc[sorted_transactions.transaction_hr.isin(hours)]
+    lng, lat = sorted_transactions.lng.to_numpy(), sorted_transactions.lat.to_numpy()
+    bounds = bounds or get_raster_bounds(lng, lat)
+    return plot_raster(rasterize_points(lng, lat, bounds, shape), bounds, **kwargs)
+
+def plot_transaction_flows(transactions, cellsites, hours=None, shape=(512, 512), bounds=None, **kwargs):
+    """Plot the number of subscriber hops (OD segments) crossing each pixel,
+    optionally for hops leaving at the given hours of the day only.
+    """
+    sorted_transactions, offsets, _ = sort_transactions(transactions, cellsites, window="month")
+    lng, lat = sorted_transactions.lng.to_numpy(), sorted_transactions.lat.to_numpy()
+    hrs = sorted_transactions.transaction_hr.to_numpy()
+    mask = get_hop_mask(offsets)
+    # only the hops that actually moved to another site
+    mask &= (lng[:-1] != lng[1:]) | (lat[:-1] != lat[1:])
+    if hours is not None:
+        mask &= np.isin(hrs[:-1], hours)
+    bounds = bounds or get_raster_bounds(lng, lat)
+    raster = rasterize_segments(lng[:-1][mask], lat[:-1][mask], lng[1:][mask], lat[1:][mask], bounds, shape)
+    return plot_raster(raster, bounds, **kwargs)
+
 def plot_total_travel_distance(sample_traj_low, sample_traj_mid, sample_traj_high):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(13, 5))
     sample_low = fetch_total_travel_distance(sample_traj_low)
@@ -1,60 +1,133 @@
-import math
 import numpy as np
 import pandas as pd
-from functools import reduce
-from shapely.geometry import Point
-from typing import List
-from shapely.wkt import loads
-from itertools import combinations
-from networkx import Graph
-from pandarallel import pandarallel
-pandarallel.initialize(verbose=0, progress_bar=False)
-from scipy.stats import truncnorm
+from functools import partial
+from typing import List, TYPE_CHECKING
+from sds4gdsp.backend import get_backend
+from sds4gdsp.profiler import profiled
+
+# shapely, networkx and scipy are slow to import and only needed by a few
+# functions, so they are imported where used to keep imports of this module light
+if TYPE_CHECKING:
+    from networkx import Graph
+    from shapely.geometry import Point
 
 def get_truncated_normal(mean=0, sd=1, low=0, upp=10):
+    from scipy.stats import truncnorm
     return truncnorm(
         (low - mean) / sd, (upp - mean) / sd, loc=mean, scale=sd
     )
 
-def get_coords_from_graph(G: Graph, nodes: List[int]):
+@profiled(rows_arg=1)
+def get_coords_from_graph(G: "Graph", nodes: List[int]):
     """Fetch lat/lng coords from graph given a list of nodes."""
-    coords = []
-    for node in nodes:
-        coords.append((G.nodes[node]["x"], G.nodes[node]["y"]))
-    return coords
+    from sds4gdsp.geometry import get_node_coords
+    lng, lat = get_node_coords(G, nodes)
+    return list(zip(lng.tolist(), lat.tolist()))
+
+def encode_cel_uids(cel_uids, cellsites: pd.DataFrame) -> np.ndarray:
+    """Map cellsite ids to their integer row positions in the cellsites table, -1 if unknown."""
+    return pd.Index(cellsites.cel_uid).get_indexer(np.asarray(cel_uids))
+
+def get_cellsite_lnglat(cellsites: pd.DataFrame, dtype=np.float64):
+    """Fetch lng/lat arrays of the cellsites table, parsing WKT coords only if needed."""
+    if "lng" in cellsites.columns and "lat" in cellsites.columns:
+        return cellsites.lng.to_numpy(dtype=dtype), cellsites.lat.to_numpy(dtype=dtype)
+    return get_lnglat_from_wkt(cellsites.coords.tolist(), dtype)
 
 def convert_cel_to_point(cel_id: str, ref: pd.DataFrame):
     """Convert cellsite to shapely point."""
+    from shapely.wkt import loads
     coord = ref.loc[ref.uid==cel_id].coords.item()
     point = loads(coord)
     return point
 
-def dedupe_points(points: List[Point], distance_threshold: int):
-    """Naive way to dedupe a points dataset given a distance threshold in meters."""
-    pointpairs_df = pd.DataFrame(list(combinations(points, 2)), columns=["p1", "p2"])
-    pointpairs_df = pointpairs_df.applymap(lambda x: x.wkt)
-    pointpairs_df["distance"] = pointpairs_df.parallel_apply(lambda x: calc_haversine_distance(x.p1, x.p2), axis=1)
-    points_df = pointpairs_df.groupby("p1").distance.min().reset_index(name="min_distance")
-    pass_threshold = points_df.min_distance >= distance_threshold
-    points_df = points_df.loc[pass_threshold].reset_index(drop=True)
-    deduped_points = points_df.p1.tolist()
+def get_points_lnglat(points: List["Point"]) -> np.ndarray:
+    return np.array([(p.x, p.y) for p in points], dtype=np.float64).reshape(-1, 2)
+
+def convert_points_to_wkt(points: List["Point"]) -> List[str]:
+    return [p.wkt for p in points]
+
+@profiled("dedupe", rows_arg=0)
+def dedupe_points(points: List["Point"], distance_threshold: int):
+    """Dedupe a points dataset (shapely points or a `PointArray`) given a distance threshold in meters.
+    A point is dropped when a later point in the list lies within the threshold,
+    candidate pairs come from a spatial index so this runs in n log n.
+    """
+    from sds4gdsp.indexer import CellsiteIndex
+    from sds4gdsp.geometry import PointArray
+    # reading .x/.y/.wkt is cheaper than pickling shapely objects to workers,
+    # so these steps run inline whatever the backend
+    if isinstance(points, PointArray):
+        lng, lat = points.lng, points.lat
+    else:
+        lnglat = get_points_lnglat(points)
+        lng, lat = lnglat[:, 0], lnglat[:, 1]
+    index = CellsiteIndex(lng, lat)
+    pairs = index.query_pairs(distance_threshold)
+    i, j = pairs[:, 0], pairs[:, 1]
+    distances = calc_haversine_distances(lng[i], lat[i], lng[j], lat[j])
+    is_dupe = np.zeros(len(points), dtype=bool)
+    is_dupe[i[distances < distance_threshold]] = True
+    if isinstance(points, PointArray):
+        return points[~is_dupe].to_wkt().tolist()
+    kept_points = [p for p, dupe in zip(points, is_dupe) if not dupe]
+    deduped_points = convert_points_to_wkt(kept_points)
     return deduped_points
 
+R_EARTH = 6_371_000 # radius of earth in meters
+HRS_IN_A_DAY = 24
+
+def parse_wkt_points(coords: List[str], dtype=np.float64) -> np.ndarray:
+    """Parse WKT point strings into a n x 2 lng/lat array."""
+    if len(coords) == 0:
+        return np.empty((0, 2), dtype=dtype)
+    # a WKT point looks like `POINT (121.05 14.52)`
+    values = " ".join(c[c.index("(")+1:c.rindex(")")] for c in coords)
+    return np.array(values.split(), dtype=dtype).reshape(-1, 2)
+
+def get_lnglat_from_wkt(coords: List[str], dtype=np.float64):
+    """Parse WKT point strings into lng/lat arrays without building shapely objects."""
+    backend = get_backend()
+    if len(coords) <= backend.chunksize:
+        lnglat = parse_wkt_points(coords, dtype)
+    else:
+        lnglat = np.vstack(backend.map_chunks(partial(parse_wkt_points, dtype=dtype), coords))
+    return lnglat[:, 0], lnglat[:, 1]
+
+def calc_haversine_distances(lng1, lat1, lng2, lat2, dtype=np.float64) -> np.ndarray:
+    """Compute for the great circle distances (in meters) between two sets of points.
+    Inputs are broadcasted against each other, so passing a scalar (or a single
+    element array) on one side computes the point-to-reference distances.
+    """
+    lng1, lat1, lng2, lat2 = map(
+        lambda z: np.radians(np.asarray(z, dtype=dtype)), [lng1, lat1, lng2, lat2]
+    )
+    # haversine formula
+    dlon = lng2 - lng1
+    dlat = lat2 - lat1
+    a = np.sin(dlat/2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2) ** 2
+    # clip guards against rounding errors pushing `a` past 1 for antipodal points
+    c = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return (c * R_EARTH).astype(dtype, copy=False)
+
+def calc_pairwise_haversine_distances(lng, lat, dtype=np.float64) -> np.ndarray:
+    """Compute for the n x n matrix of great circle distances (in meters)."""
+    lng, lat = np.asarray(lng), np.asarray(lat)
+    return calc_haversine_distances(lng[:, None], lat[:, None], lng[None, :], lat[None, :], dtype)
+
+def calc_consecutive_haversine_distances(lng, lat, dtype=np.float64) -> np.ndarray:
+    """Compute for the lag-1 great circle distances (in meters) along a trajectory."""
+    lng, lat = np.asarray(lng), np.asarray(lat)
+    return calc_haversine_distances(lng[:-1], lat[:-1], lng[1:], lat[1:], dtype)
+
+def calc_reference_haversine_distances(lng, lat, ref_lng, ref_lat, dtype=np.float64) -> np.ndarray:
+    """Compute for the great circle distances (in meters) of n points to a single reference point."""
+    return calc_haversine_distances(lng, lat, ref_lng, ref_lat, dtype)
+
 def calc_haversine_distance(p1: str, p2: str) -> float:
     """Compute for the great circle distance between two points on the earth."""
-    p1, p2 = loads(p1), loads(p2)
-    lng1, lat1 = p1.x, p1.y
-    lng2, lat2 = p2.x, p2.y
-    R = 6371 # radius of earth in kilometers
-    # convert decimal degrees to radians
-    lng1, lat1, lng2, lat2 = map(math.radians, [lng1, lat1, lng2, lat2])
-    # haversine formula
-    dlon = lng2 - lng1 
-    dlat = lat2 - lat1 
-    a = math.sin(dlat/2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2) ** 2
-    c = 2 * math.asin(math.sqrt(a))
-    d = c * R * 1_000 # convert back to meters
-    return d
+    (lng1, lng2), (lat1, lat2) = get_lnglat_from_wkt([p1, p2])
+    return float(calc_haversine_distances(lng1, lat1, lng2, lat2))
 
 def apply_softmax(arr: np.ndarray) -> np.ndarray:
     # subtracting the max value for numerical stability
@@ -69,26 +142,68 @@ def convert_distances_to_probas(distances) -> np.ndarray:
 def scale_feature(feature, scaler) -> np.ndarray:
     return scaler.fit_transform(np.array(feature).reshape(-1, 1)).flatten()
 
-def calc_total_travel_distance(traj):
-    coords = traj.coords.tolist()
-    od_pairs = list(zip(coords, coords[1:]))
-    total_travel_distance = reduce(
-        lambda a, b: a + b,
-        list(map(lambda p: calc_haversine_distance(*p), od_pairs))
-    )
-    return total_travel_distance
+def calc_traj_hop_distances(traj, distance_cache=None) -> np.ndarray:
+    """Compute for the lag-1 distances (in meters) along a trajectory. With a
+    `CellDistanceCache` (see `sds4gdsp.distances`), they are read by cellsite id
+    and the `coords` column is not needed.
+    """
+    if distance_cache is None:
+        lng, lat = get_lnglat_from_wkt(traj.coords.tolist())
+        return calc_consecutive_haversine_distances(lng, lat)
+    cel_codes = distance_cache.encode(traj.cel_uid)
+    return distance_cache.lookup(cel_codes[:-1], cel_codes[1:]).astype(np.float64)
 
-def fetch_total_travel_distance(traj):
-    coords = traj.coords.tolist()
-    od_pairs = list(zip(coords, coords[1:]))
+@profiled(rows_arg=0)
+def calc_total_travel_distance(traj, distance_cache=None):
+    total_travel_distance = calc_traj_hop_distances(traj, distance_cache).sum()
+    return float(total_travel_distance)
+
+@profiled(rows_arg=0)
+def fetch_total_travel_distance(traj, distance_cache=None):
     dts = traj.transaction_dt.tolist()
     hrs = traj.transaction_hr.tolist()
     cels = traj.cel_uid.tolist()
-    hr_pairs = list(zip(hrs, hrs[1:]))
-    travel_distances = list(map(lambda p: calc_haversine_distance(*p), od_pairs))
+    travel_distances = calc_traj_hop_distances(traj, distance_cache)
     dt_df = pd.DataFrame(list(zip(dts, dts[1:])), columns=["orig_dt", "dest_dt"])
     hr_df = pd.DataFrame(list(zip(hrs, hrs[1:])), columns=["orig_hr", "dest_hr"])
     cel_df = pd.DataFrame(list(zip(cels, cels[1:])), columns=["orig_cel", "dest_cel"])
     data = pd.concat([dt_df, hr_df, cel_df], axis=1)
     data["travel_distance"] = travel_distances
-    return data.loc[data.travel_distance>0].reset_index(drop=True)
\ No newline at end of file
+    return data.loc[data.travel_distance>0].reset_index(drop=True)
+
+def calc_elapsed_hours(orig_hr, dest_hr) -> np.ndarray:
+    """Compute for the hours spent on the origin site of each hop.
+    A destination hour at or before the origin hour means the hop jumped to another day.
+    """
+    orig_hr, dest_hr = np.asarray(orig_hr), np.asarray(dest_hr)
+    return np.where(dest_hr > orig_hr, dest_hr - orig_hr, HRS_IN_A_DAY - np.abs(dest_hr - orig_hr))
+
+def calc_entropy(probas) -> float:
+    """Compute for sum(p * log2(1/p)), sites with zero probability contribute nothing."""
+    probas = np.asarray(probas, dtype=np.float64)
+    probas = probas[probas > 0]
+    return float(np.sum(probas * np.log2(1 / probas)))
+
+@profiled(rows_arg=0)
+def calc_radius_of_gyration(traj):
+    lng, lat = get_lnglat_from_wkt(traj.coords.tolist())
+    # compute for the center of mass
+    from shapely.geometry import Point
+    mean_lng, mean_lat = lng.mean(), lat.mean()
+    com = Point(mean_lng, mean_lat).wkt
+    # compute for the distances from CoM to individual points
+    distances = calc_reference_haversine_distances(lng, lat, mean_lng, mean_lat)
+    radius_of_gyration = float(np.sqrt(np.mean(distances ** 2)))
+    return com, radius_of_gyration
+
+@profiled(rows_arg=0)
+def calc_activity_entropy(traj):
+    if len(traj) < 2:
+        return None
+    cels = traj.cel_uid.to_numpy()
+    hrs = traj.transaction_hr.to_numpy()
+    # time spent on a single site vs time spent on all sites
+    time_elapsed = calc_elapsed_hours(hrs[:-1], hrs[1:])
+    loc_hr_counter = pd.Series(time_elapsed).groupby(cels[:-1]).sum()
+    proba_per_site = loc_hr_counter.to_numpy() / loc_hr_counter.sum()
+    return calc_entropy(proba_per_site)
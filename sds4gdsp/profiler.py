@@ -0,0 +1,173 @@
+import os
+import sys
+import csv
+import json
+import time
+import pstats
+import cProfile
+import functools
+from typing import Callable
+
+try:
+    import resource
+except ImportError: # not available on windows
+    resource = None
+
+def get_peak_rss_mb() -> float:
+    """Fetch the peak resident set size of the process so far, in MB."""
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macos, in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+class Span:
+    """A single run of a stage, set `rows` to record how much it processed."""
+
+    __slots__ = ("profiler", "name", "path", "rows", "start", "start_rss_mb")
+
+    def __init__(self, profiler: "Profiler", name: str, rows: int = None):
+        self.profiler = profiler
+        self.name = name
+        self.path = "/".join(profiler.stack + [name])
+        self.rows = rows
+
+    def __enter__(self):
+        self.profiler.enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.exit(self)
+        return False
+
+    def set_rows(self, rows: int) -> None:
+        self.rows = rows
+
+class NullSpan:
+    """Stands in for spans when profiling is disabled, so that it costs next to nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_rows(self, rows: int) -> None:
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Profiler:
+    """Aggregates the timings, row counts and peak RSS of named stages.
+
+    Spans nest, and are reported per path (e.g. `make_transactions/write_csv`) with
+    their number of calls, so functions that run once per trajectory stay a single
+    row of the report. The stage named `profile_stage`, if any, also runs under
+    cProfile. Spans entered in worker processes are not collected, wrap the pool.
+    """
+
+    def __init__(self, enabled: bool = False, profile_stage: str = None, dirpath: str = "."):
+        self.enabled = enabled
+        self.profile_stage = profile_stage
+        self.dirpath = dirpath
+        self.stats = {}
+        self.stack = []
+        self.cprofile = None
+        self.cprofile_depth = 0
+
+    def span(self, name: str, rows: int = None):
+        return Span(self, name, rows) if self.enabled else NULL_SPAN
+
+    def enter(self, span: Span) -> None:
+        self.stack.append(span.name)
+        if span.name == self.profile_stage:
+            if self.cprofile is None:
+                self.cprofile = cProfile.Profile()
+            if self.cprofile_depth == 0:
+                self.cprofile.enable()
+            self.cprofile_depth += 1
+        span.start_rss_mb = get_peak_rss_mb()
+        span.start = time.perf_counter()
+
+    def exit(self, span: Span) -> None:
+        seconds = time.perf_counter() - span.start
+        peak_rss_mb = get_peak_rss_mb()
+        if span.name == self.profile_stage:
+            self.cprofile_depth -= 1
+            if self.cprofile_depth == 0:
+                self.cprofile.disable()
+        self.stack.pop()
+        stats = self.stats.setdefault(span.path, dict(
+            stage=span.path, calls=0, seconds=0.0, rows=0, peak_rss_mb=0.0, rss_growth_mb=0.0
+        ))
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["rows"] += span.rows or 0
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], peak_rss_mb)
+        # how much the stage raised the peak of the process
+        stats["rss_growth_mb"] = max(stats["rss_growth_mb"], peak_rss_mb - span.start_rss_mb)
+
+    def get_report(self) -> list:
+        report = []
+        for stats in self.stats.values():
+            stats = dict(stats)
+            stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["rows"] and stats["seconds"] > 0 else None
+            report.append(stats)
+        return report
+
+    def save(self, filename: str = "profile") -> None:
+        """Write the report as JSON and CSV, and the cProfile stats if a stage was profiled."""
+        if not self.enabled:
+            return
+        os.makedirs(self.dirpath, exist_ok=True)
+        report = self.get_report()
+        with open(os.path.join(self.dirpath, f"{filename}.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(self.dirpath, f"{filename}.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(report[0]) if report else ["stage"])
+            writer.writeheader()
+            writer.writerows(report)
+        if self.cprofile is not None:
+            filepath = os.path.join(self.dirpath, f"{filename}-{self.profile_stage}")
+            self.cprofile.dump_stats(f"{filepath}.prof")
+            with open(f"{filepath}.txt", "w") as f:
+                pstats.Stats(self.cprofile, stream=f).sort_stats("cumulative").print_stats(50)
+        print(f"OK. Profile saved in '{self.dirpath}'")
+
+_profiler = Profiler()
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+def configure_profiler(enabled: bool = False, profile_stage: str = None, dirpath: str = ".") -> Profiler:
+    """Replace the process-wide profiler, disabled by default."""
+    global _profiler
+    _profiler = Profiler(enabled, profile_stage, dirpath)
+    return _profiler
+
+def span(name: str, rows: int = None):
+    """Time a stage with the process-wide profiler, e.g.
+
+    with span("dedupe", rows=len(points)):
+        ...
+    """
+    return _profiler.span(name, rows)
+
+def profiled(name: str = None, rows_arg: int = None) -> Callable:
+    """Decorate a function to run as a span, counting the length of its
+    positional argument `rows_arg` (if given) as the rows processed.
+    """
+    def decorator(func):
+        stage = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return func(*args, **kwargs)
+            rows = len(args[rows_arg]) if rows_arg is not None and len(args) > rows_arg else None
+            with Span(_profiler, stage, rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
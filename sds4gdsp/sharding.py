@@ -0,0 +1,85 @@
+import os
+import glob
+import itertools
+import numpy as np
+import pandas as pd
+from typing import Callable, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from sds4gdsp.profiler import span
+
+def get_shard_bounds(num_items: int, num_shards: int) -> List[Tuple[int, int]]:
+    """Split [0, num_items) into `num_shards` contiguous ranges of near equal size."""
+    edges = np.linspace(0, num_items, num_shards + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+STREAMS = ("subscribers", "transactions")
+
+def get_shard_rng(seed: int, shard_id: int, stream: str) -> np.random.Generator:
+    """Derive an independent random stream for a shard of a dataset from the global seed.
+    The stream only depends on (seed, stream, shard_id), never on which worker runs it,
+    and shard i of the subscribers never shares its draws with shard i of the transactions.
+    """
+    if stream not in STREAMS:
+        raise ValueError(f"unknown stream '{stream}', expected one of {STREAMS}")
+    spawn_key = (STREAMS.index(stream), shard_id)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=spawn_key))
+
+def get_part_filepath(filepath: str, shard_id: int, num_shards: int) -> str:
+    """Fetch the part-file of a shard, e.g. `data/x.csv` -> `data/x-part-00001.csv`.
+    A single shard writes to the original filepath.
+    """
+    if num_shards == 1:
+        return filepath
+    root, ext = os.path.splitext(filepath)
+    return f"{root}-part-{str(shard_id).zfill(5)}{ext}"
+
+def get_part_filepaths(filepath: str, num_shards: int) -> List[str]:
+    return [get_part_filepath(filepath, shard_id, num_shards) for shard_id in range(num_shards)]
+
+def count_part_files(filepath: str) -> int:
+    """Count the part-files of a dataset on disk, 1 for a dataset written as a single file."""
+    root, ext = os.path.splitext(filepath)
+    num_parts = len(glob.glob(f"{glob.escape(root)}-part-[0-9][0-9][0-9][0-9][0-9]{glob.escape(ext)}"))
+    return num_parts or int(os.path.exists(filepath))
+
+def read_csv_parts(filepath: str, num_shards: int, **kwargs) -> pd.DataFrame:
+    """Read back the part-files of a sharded dataset in shard order, raises if the
+    dataset on disk was written with a different number of shards.
+    """
+    num_parts = count_part_files(filepath)
+    if num_parts and num_parts != num_shards:
+        raise ValueError(
+            f"'{filepath}' has {num_parts} part-file/s on disk but {num_shards} shard/s were expected, "
+            "set sharding.num_shards to the value it was written with, or remove the part-files and write it again"
+        )
+    parts = [pd.read_csv(f, **kwargs) for f in get_part_filepaths(filepath, num_shards)]
+    return pd.concat(parts, ignore_index=True)
+
+def write_shard(func: Callable, filepath: str, shard_id: int, num_shards: int, **kwargs) -> int:
+    """Run `func(**kwargs)` and write its output to the shard's part-file.
+    The output can be a single DataFrame or an iterable of DataFrame chunks.
+    """
+    part_filepath = get_part_filepath(filepath, shard_id, num_shards)
+    with span(func.__name__):
+        data = func(**kwargs)
+    chunks = iter([data] if isinstance(data, pd.DataFrame) else data)
+    num_rows = 0
+    for i in itertools.count():
+        # generators only do their work when the next chunk is asked for
+        with span(func.__name__) as s:
+            chunk = next(chunks, None)
+            s.set_rows(0 if chunk is None else len(chunk))
+        if chunk is None:
+            break
+        with span("write_csv", rows=len(chunk)):
+            chunk.to_csv(part_filepath, index=False, mode="w" if i==0 else "a", header=i==0)
+        num_rows += len(chunk)
+    return num_rows
+
+def run_shards(tasks: List[Callable], num_workers: int = 1) -> list:
+    """Run the shard tasks in a process pool, or serially with a single worker."""
+    if num_workers <= 1 or len(tasks) <= 1:
+        return [task() for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(num_workers, len(tasks))) as executor:
+        futures = [executor.submit(task) for task in tasks]
+        return [future.result() for future in futures]
@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Sequence, Union
+
+METRICS = ("total_travel_distance", "radius_of_gyration", "activity_entropy")
+TIERS = ("low", "mid", "high")
+
+class QuantileSketch:
+    """A mergeable quantile sketch of non negative values with relative error `alpha`.
+
+    Values are counted in logarithmic buckets (as in DDSketch): bucket k holds the
+    values in (gamma^(k-1), gamma^k] with gamma = (1 + alpha) / (1 - alpha), so any
+    quantile is returned within a factor of (1 +/- alpha) of the exact one, e.g.
+    within 1% of the exact distance for the default `alpha`. Values below
+    `min_value` go to a zero bucket. Memory is bounded by `max_buckets` counts:
+    keys more than `max_buckets` below the largest key seen are folded into the
+    lowest kept bucket, which only loses accuracy in the lowest quantiles. Since
+    that cut off only depends on the largest key, which merges never lower,
+    sketches built over chunks (or by workers) merge into the same counts as a
+    single sketch over all the values, whatever the merge order.
+    """
+
+    def __init__(self, alpha: float = 0.01, max_buckets: int = 2048, min_value: float = 1e-9):
+        if not 0 < alpha < 1:
+            raise ValueError("alpha should be between 0 and 1")
+        self.alpha = alpha
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = np.log(self.gamma)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.min_key = 0
+        self.zero_count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __len__(self):
+        return self.zero_count + int(self.counts.sum())
+
+    def get_keys(self, values: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def get_values(self, keys: np.ndarray) -> np.ndarray:
+        """Fetch the value that represents each bucket, which is within `alpha` of all its values."""
+        return 2 * self.gamma ** keys.astype(np.float64) / (self.gamma + 1)
+
+    def add_counts(self, min_key: int, counts: np.ndarray) -> None:
+        """Add dense bucket counts starting at `min_key`, growing (and collapsing) the store as needed."""
+        if len(counts) == 0:
+            return
+        if len(self.counts) == 0:
+            self.min_key, self.counts = min_key, counts.astype(np.int64)
+        else:
+            lo = min(self.min_key, min_key)
+            hi = max(self.min_key + len(self.counts), min_key + len(counts))
+            merged = np.zeros(hi - lo, dtype=np.int64)
+            merged[self.min_key-lo:self.min_key-lo+len(self.counts)] += self.counts
+            merged[min_key-lo:min_key-lo+len(counts)] += counts
+            self.min_key, self.counts = lo, merged
+        # fold the keys below the cut off into the lowest bucket that is kept, the
+        # store always ends at the largest key seen so the cut off never goes down
+        floor_key = self.min_key + len(self.counts) - self.max_buckets
+        if self.min_key < floor_key:
+            num_extra = floor_key - self.min_key
+            self.counts[num_extra] += self.counts[:num_extra].sum()
+            self.counts = self.counts[num_extra:]
+            self.min_key = floor_key
+
+    def update(self, values) -> "QuantileSketch":
+        """Add a chunk of values, NaNs (e.g. undefined entropies) are ignored."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        if (values < 0).any():
+            raise ValueError("expected non negative values")
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        is_zero = values < self.min_value
+        self.zero_count += int(is_zero.sum())
+        keys = self.get_keys(values[~is_zero])
+        if len(keys):
+            min_key = int(keys.min())
+            self.add_counts(min_key, np.bincount(keys - min_key))
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Add the counts of another sketch with the same `alpha` into this one."""
+        if other.alpha != self.alpha or other.min_value != self.min_value:
+            raise ValueError("only sketches with the same alpha and min_value can be merged")
+        self.add_counts(other.min_key, other.counts)
+        self.zero_count += other.zero_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def get_quantiles(self, qs) -> np.ndarray:
+        """Fetch the approximate quantiles (between 0 and 1), NaN if the sketch is empty."""
+        qs = np.asarray(qs, dtype=np.float64)
+        n = len(self)
+        if n == 0:
+            return np.full(qs.shape, np.nan)
+        if ((qs < 0) | (qs > 1)).any():
+            raise ValueError("quantiles should be between 0 and 1")
+        # lower rank, same as `np.quantile(..., method="lower")`
+        ranks = np.floor(qs * (n - 1))
+        cum_counts = self.zero_count + np.cumsum(self.counts)
+        positions = np.searchsorted(cum_counts, ranks, side="right")
+        values = self.get_values(self.min_key + np.minimum(positions, len(self.counts) - 1))
+        values = np.where(ranks < self.zero_count, 0.0, values)
+        # the exact extremes are known, and no estimate should fall outside of them
+        return np.clip(values, self.min, self.max)
+
+    def get_quantile(self, q: float) -> float:
+        return float(self.get_quantiles([q])[0])
+
+    def get_ranks(self, values) -> np.ndarray:
+        """Fetch the approximate percentile rank (fraction of values at or below) of each value."""
+        values = np.asarray(values, dtype=np.float64)
+        n = len(self)
+        if n == 0:
+            return np.full(values.shape, np.nan)
+        cum_counts = np.concatenate([[0], np.cumsum(self.counts)])
+        positive = np.maximum(np.nan_to_num(values, nan=self.min_value), self.min_value)
+        positions = np.clip(self.get_keys(positive) - self.min_key + 1, 0, len(self.counts))
+        ranks = np.where(values < self.min_value, 0, cum_counts[positions]) + self.zero_count
+        ranks = np.where(values < 0, 0, ranks) / n
+        return np.where(np.isnan(values), np.nan, ranks)
+
+    def assign_buckets(self, values, qs: Sequence[float] = (1/3, 2/3)) -> np.ndarray:
+        """Assign each value to the bucket between consecutive `qs` cut points by its
+        percentile rank, 0 to len(qs) with the defaults splitting values into thirds,
+        -1 for NaN. Values sharing a sketch bucket always share a tier, so tiers
+        of tightly clustered values (e.g. entropies) may be a bit uneven.
+        """
+        ranks = self.get_ranks(values)
+        buckets = np.searchsorted(np.asarray(qs, dtype=np.float64), ranks, side="left")
+        return np.where(np.isnan(ranks), -1, buckets)
+
+    def to_dict(self) -> dict:
+        return dict(
+            alpha=np.array(self.alpha), max_buckets=np.array(self.max_buckets),
+            min_value=np.array(self.min_value), min_key=np.array(self.min_key),
+            counts=self.counts, zero_count=np.array(self.zero_count),
+            min=np.array(self.min), max=np.array(self.max)
+        )
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "QuantileSketch":
+        sketch = cls(float(state["alpha"]), int(state["max_buckets"]), float(state["min_value"]))
+        sketch.min_key = int(state["min_key"])
+        sketch.counts = np.asarray(state["counts"], dtype=np.int64)
+        sketch.zero_count = int(state["zero_count"])
+        sketch.min, sketch.max = float(state["min"]), float(state["max"])
+        return sketch
+
+class MetricSketches:
+    """A quantile sketch per mobility index, fed with the chunks (or the per worker
+    results) of `calc_mobility_indices` so subscribers can be tiered into low, mid
+    and high without holding or sorting the full scoring base.
+    """
+
+    def __init__(self, metrics: Sequence[str] = METRICS, alpha: float = 0.01, max_buckets: int = 2048):
+        self.sketches: Dict[str, QuantileSketch] = {
+            metric: QuantileSketch(alpha, max_buckets) for metric in metrics
+        }
+
+    def __getitem__(self, metric: str) -> QuantileSketch:
+        return self.sketches[metric]
+
+    def update(self, scoring_base: pd.DataFrame) -> "MetricSketches":
+        for metric, sketch in self.sketches.items():
+            sketch.update(scoring_base[metric].to_numpy(dtype=np.float64))
+        return self
+
+    def merge(self, other: "MetricSketches") -> "MetricSketches":
+        for metric, sketch in self.sketches.items():
+            sketch.merge(other[metric])
+        return self
+
+    def get_quantiles(self, qs: Sequence[float] = (0.25, 0.5, 0.75)) -> pd.DataFrame:
+        """Fetch the approximate quantiles of every metric, one row per quantile."""
+        return pd.DataFrame(
+            {metric: sketch.get_quantiles(qs) for metric, sketch in self.sketches.items()},
+            index=pd.Index(qs, name="quantile")
+        )
+
+    def assign_tiers(
+        self, scoring_base: pd.DataFrame, qs: Sequence[float] = (1/3, 2/3), tiers: Sequence[str] = TIERS
+    ) -> pd.DataFrame:
+        """Add a `{metric}_rank` and `{metric}_tier` column per metric to a chunk of the scoring base."""
+        if len(tiers) != len(qs) + 1:
+            raise ValueError("expected one more tier than cut points")
+        labels = np.array(list(tiers) + [None], dtype=object)
+        scoring_base = scoring_base.copy()
+        for metric, sketch in self.sketches.items():
+            values = scoring_base[metric].to_numpy(dtype=np.float64)
+            scoring_base[f"{metric}_rank"] = sketch.get_ranks(values)
+            # -1 (NaN values) picks the trailing None
+            scoring_base[f"{metric}_tier"] = labels[sketch.assign_buckets(values, qs)]
+        return scoring_base
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, **{
+            f"{metric}/{name}": value
+            for metric, sketch in self.sketches.items()
+            for name, value in sketch.to_dict().items()
+        })
+
+    @classmethod
+    def load(cls, path: str) -> "MetricSketches":
+        sketches = cls(metrics=())
+        with np.load(path, allow_pickle=False) as state:
+            metrics = list(dict.fromkeys(key.split("/")[0] for key in state.files))
+            for metric in metrics:
+                sketches.sketches[metric] = QuantileSketch.from_dict({
+                    key.split("/")[1]: state[key] for key in state.files if key.startswith(f"{metric}/")
+                })
+        return sketches
+
+def sketch_mobility_indices(
+    filepaths: Union[str, List[str]],
+    cellsites: pd.DataFrame,
+    window: str = "month",
+    alpha: float = 0.01,
+    memory_budget: int = 512 * 2**20
+) -> MetricSketches:
+    """Sketch the mobility indices of transaction files that may not fit in memory,
+    one hash partition of the subscribers at a time (see `sds4gdsp.streaming`).
+    The indices are computed on the arrays each store already sorted.
+    """
+    from sds4gdsp.mobility import calc_group_mobility_indices
+    from sds4gdsp.streaming import iter_partitions
+    sketches = MetricSketches(alpha=alpha)
+    for store in iter_partitions(filepaths, cellsites, memory_budget):
+        indices = calc_group_mobility_indices(
+            store.get_group_offsets(window), store.lng, store.lat, store.cel_codes, store.hrs, len(cellsites)
+        )
+        sketches.update(pd.DataFrame(indices))
+    return sketches
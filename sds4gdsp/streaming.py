@@ -0,0 +1,76 @@
+import os
+import math
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import List, Union
+from sds4gdsp.trajectory import TrajectoryStore
+
+# rough in-memory size of a transaction row held by pandas (object strings included)
+BYTES_PER_ROW = 400
+# rough in-memory size of a transaction csv once loaded by pandas
+CSV_EXPANSION = 4
+
+def get_num_partitions(filepaths: List[str], memory_budget: int) -> int:
+    """Fetch the number of hash partitions needed for one partition to fit the memory budget."""
+    num_bytes = sum(os.path.getsize(f) for f in filepaths)
+    return max(1, math.ceil(num_bytes * CSV_EXPANSION / memory_budget))
+
+def hash_partition(sub_uids, num_partitions: int) -> np.ndarray:
+    """Assign subscribers to partitions with a hash that is stable across runs and processes."""
+    hashes = pd.util.hash_array(np.asarray(sub_uids, dtype=object))
+    return (hashes % np.uint64(num_partitions)).astype(np.int64)
+
+def spill_partitions(filepaths: List[str], num_partitions: int, dirpath: str, chunksize: int) -> List[str]:
+    """Read the transactions chunk by chunk and append each row to its sub's partition file."""
+    partition_filepaths = [os.path.join(dirpath, f"partition-{str(i).zfill(5)}.csv") for i in range(num_partitions)]
+    has_header = [False] * num_partitions
+    for filepath in filepaths:
+        for chunk in pd.read_csv(filepath, chunksize=chunksize):
+            partitions = hash_partition(chunk.sub_uid, num_partitions)
+            for i, data in chunk.groupby(partitions):
+                data.to_csv(partition_filepaths[i], index=False, mode="a", header=not has_header[i])
+                has_header[i] = True
+    return [f for f, exists in zip(partition_filepaths, has_header) if exists]
+
+def iter_partitions(
+    filepaths: Union[str, List[str]],
+    cellsites: pd.DataFrame,
+    memory_budget: int = 512 * 2**20,
+    tmpdir: str = None,
+    chunksize: int = None
+):
+    """Yield a TrajectoryStore per hash partition of the subscribers.
+
+    The transactions are read in chunks and spilled to one file per partition under
+    a temp directory (in `tmpdir` if given), with enough partitions for a single one
+    to fit in `memory_budget` bytes. Every subscriber lands in exactly one partition,
+    so each store holds complete trajectories. When the whole input fits the budget,
+    it is loaded directly without spilling.
+    """
+    filepaths = [filepaths] if isinstance(filepaths, str) else list(filepaths)
+    num_partitions = get_num_partitions(filepaths, memory_budget)
+    if num_partitions == 1:
+        transactions = pd.concat([pd.read_csv(f) for f in filepaths], ignore_index=True)
+        yield TrajectoryStore(transactions, cellsites)
+        return
+    # a chunk uses at most a quarter of the budget while spilling
+    chunksize = chunksize or max(1_000, memory_budget // (BYTES_PER_ROW * 4))
+    with tempfile.TemporaryDirectory(prefix="sds4gdsp-", dir=tmpdir) as dirpath:
+        for partition_filepath in spill_partitions(filepaths, num_partitions, dirpath, chunksize):
+            yield TrajectoryStore(pd.read_csv(partition_filepath), cellsites)
+            os.remove(partition_filepath)
+
+def iter_sub_trajs(
+    filepaths: Union[str, List[str]],
+    cellsites: pd.DataFrame,
+    memory_budget: int = 512 * 2**20,
+    tmpdir: str = None,
+    chunksize: int = None
+):
+    """Yield (sub_uid, traj) for every subscriber of transaction files that may not fit in memory.
+    Each traj is complete and in the same format as `get_sub_traj`, so the metric
+    functions in `sds4gdsp.processor` can consume it as is.
+    """
+    for store in iter_partitions(filepaths, cellsites, memory_budget, tmpdir, chunksize):
+        yield from store.iter_sub_trajs()
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from sds4gdsp.mobility import sort_transactions
+
+class TrajectoryStore:
+    """Transactions sorted once by (sub_uid, transaction_dt, transaction_hr) with
+    CSR style offsets per subscriber and per subscriber-day, so fetching the
+    trajectory of any subscriber for a day or a month is a slice, not a scan.
+    """
+
+    def __init__(self, transactions: pd.DataFrame, cellsites: pd.DataFrame):
+        sorted_transactions, day_offsets, days = sort_transactions(transactions, cellsites, window="day")
+        # cellsite coords are pre-joined as float arrays
+        self.cel_codes = sorted_transactions.pop("cel_code").to_numpy()
+        self.lng = sorted_transactions.pop("lng").to_numpy()
+        self.lat = sorted_transactions.pop("lat").to_numpy()
+        self.hrs = sorted_transactions.transaction_hr.to_numpy()
+        if "coords" in cellsites.columns:
+            sorted_transactions["coords"] = cellsites.coords.to_numpy()[self.cel_codes]
+        self.transactions = sorted_transactions
+        self.cellsites = cellsites
+        # day level index: rows of day group g are day_offsets[g]:day_offsets[g+1]
+        self.day_offsets = day_offsets
+        self.days = days.transaction_dt.to_numpy().astype(str)
+        # sub level index: day groups of sub s are sub_offsets[s]:sub_offsets[s+1]
+        sub_codes, self.sub_uids = pd.factorize(days.sub_uid, sort=True)
+        is_start = np.ones(len(sub_codes), dtype=bool)
+        is_start[1:] = sub_codes[1:] != sub_codes[:-1]
+        self.sub_offsets = np.append(np.flatnonzero(is_start), len(sub_codes))
+
+    def __len__(self):
+        return len(self.sub_uids)
+
+    def get_rows(self, sub: str, date: str = None, window: str = "month"):
+        """Fetch the (start, stop) rows of a subscriber's trajectory for a day or a month.
+        Without a date, the whole trajectory of the subscriber is returned.
+        """
+        s = self.sub_uids.get_indexer([sub])[0]
+        if s < 0:
+            return 0, 0
+        g0, g1 = self.sub_offsets[s], self.sub_offsets[s+1]
+        if date is not None:
+            days = self.days[g0:g1]
+            if window == "month":
+                # ISO date strings, every day of the month sorts between these two keys
+                lo, hi = date[:7] + "-01", date[:7] + "-31"
+            elif window == "day":
+                lo, hi = date, date
+            else:
+                raise ValueError(f"unknown window '{window}', expected 'month' or 'day'")
+            g0, g1 = g0 + np.searchsorted(days, lo, side="left"), g0 + np.searchsorted(days, hi, side="right")
+        return self.day_offsets[g0], self.day_offsets[g1]
+
+    def get_group_offsets(self, window: str = "month") -> np.ndarray:
+        """Fetch the row offsets of every (sub, month) or (sub, day) group, the same
+        groups `sort_transactions` delimits, from the index without sorting again.
+        """
+        if window == "day":
+            return self.day_offsets
+        if window != "month":
+            raise ValueError(f"unknown window '{window}', expected 'month' or 'day'")
+        day_subs = np.repeat(np.arange(len(self)), np.diff(self.sub_offsets))
+        months = self.days.astype("U7")
+        is_start = np.ones(len(day_subs), dtype=bool)
+        is_start[1:] = (day_subs[1:] != day_subs[:-1]) | (months[1:] != months[:-1])
+        return np.append(self.day_offsets[:-1][is_start], self.day_offsets[-1])
+
+    def get_arrays(self, sub: str, date: str = None, window: str = "month"):
+        """Fetch lng, lat, cellsite codes and hours of a subscriber's trajectory as array views."""
+        start, stop = self.get_rows(sub, date, window)
+        return self.lng[start:stop], self.lat[start:stop], self.cel_codes[start:stop], self.hrs[start:stop]
+
+    def get_sub_traj(self, sub: str, date: str, window: str) -> pd.DataFrame:
+        """Same output as the notebook's `get_sub_traj` without scanning the transactions."""
+        start, stop = self.get_rows(sub, date, window)
+        return self.transactions.iloc[start:stop].reset_index(drop=True)
+
+    def iter_sub_trajs(self, date: str = None, window: str = "month"):
+        """Yield (sub_uid, traj) for every subscriber in the store."""
+        for sub in self.sub_uids:
+            yield sub, self.get_sub_traj(sub, date, window)
+
+def fetch_sample_trajs(scoring_base, metric, date, window, store: TrajectoryStore):
+    """Fetch the trajectories of the subscribers with the lowest, median and highest metric."""
+    scoring_base = scoring_base.sort_values(by=metric, ascending=True).reset_index(drop=True)
+    sample_sub_low = scoring_base.loc[0, "sub_uid"]
+    sample_sub_mid = scoring_base.loc[len(scoring_base)//2, "sub_uid"]
+    sample_sub_high = scoring_base.loc[len(scoring_base)-1, "sub_uid"]
+    sample_traj_low = store.get_sub_traj(sample_sub_low, date, window)
+    sample_traj_mid = store.get_sub_traj(sample_sub_mid, date, window)
+    sample_traj_high = store.get_sub_traj(sample_sub_high, date, window)
+    return sample_traj_low, sample_traj_mid, sample_traj_high
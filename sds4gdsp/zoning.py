@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+from sds4gdsp.processor import R_EARTH, get_cellsite_lnglat
+
+def project_lnglat(lng, lat, ref_lat: float):
+    """Project lng/lat to meters on a local equirectangular plane, true to scale around `ref_lat`."""
+    x = R_EARTH * np.radians(np.asarray(lng, dtype=np.float64)) * np.cos(np.radians(ref_lat))
+    y = R_EARTH * np.radians(np.asarray(lat, dtype=np.float64))
+    return x, y
+
+def unproject_xy(x, y, ref_lat: float):
+    lng = np.degrees(np.asarray(x) / (R_EARTH * np.cos(np.radians(ref_lat))))
+    lat = np.degrees(np.asarray(y) / R_EARTH)
+    return lng, lat
+
+def assign_grid_cells(lng, lat, cell_size: float, ref_lat: float) -> np.ndarray:
+    """Fetch the (column, row) of the `cell_size` meters square grid cell of each point."""
+    x, y = project_lnglat(lng, lat, ref_lat)
+    return np.column_stack([np.floor(x / cell_size), np.floor(y / cell_size)]).astype(np.int64)
+
+def assign_hex_cells(lng, lat, size: float, ref_lat: float) -> np.ndarray:
+    """Fetch the axial (q, r) of the pointy top hexagon of each point, `size` is the
+    center to corner distance in meters (so hexagons are sqrt(3) * size wide).
+    """
+    x, y = project_lnglat(lng, lat, ref_lat)
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # round in cube coordinates, fixing the component with the largest rounding error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return np.column_stack([rq, rr]).astype(np.int64)
+
+def get_grid_centers(cells: np.ndarray, cell_size: float, ref_lat: float):
+    return unproject_xy((cells[:, 0] + 0.5) * cell_size, (cells[:, 1] + 0.5) * cell_size, ref_lat)
+
+def get_hex_centers(cells: np.ndarray, size: float, ref_lat: float):
+    q, r = cells[:, 0], cells[:, 1]
+    return unproject_xy(size * np.sqrt(3) * (q + r / 2), size * 1.5 * r, ref_lat)
+
+def assign_polygons(lng, lat, polygons) -> np.ndarray:
+    """Fetch the position of the (first) polygon containing each point, -1 if none does."""
+    import shapely
+    lng, lat = np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    zones = np.full(len(lng), -1, dtype=np.int64)
+    for i, polygon in enumerate(polygons):
+        minx, miny, maxx, maxy = polygon.bounds
+        # only test the unassigned points within the bounding box
+        candidates = np.flatnonzero((zones < 0) & (lng >= minx) & (lng <= maxx) & (lat >= miny) & (lat <= maxy))
+        if len(candidates) == 0:
+            continue
+        if hasattr(shapely, "contains_xy"): # shapely 2
+            inside = shapely.contains_xy(polygon, lng[candidates], lat[candidates])
+        else:
+            from shapely.vectorized import contains
+            inside = contains(polygon, lng[candidates], lat[candidates])
+        zones[candidates[inside]] = i
+    return zones
+
+class ZoneIndex:
+    """The zone (grid cell, hexagon or polygon) of every cellsite as an integer array.
+
+    Geometry work happens once per cellsite when the index is built, so zoning
+    transactions is a gather of `cel_zones` by cellsite code, and aggregating them
+    a bincount over the zones. Cellsites outside of every zone get -1 and are left
+    out of aggregates. Cellsite codes are row positions in the cellsites table the
+    index was built from.
+    """
+
+    def __init__(self, cel_zones, zones: pd.DataFrame, cel_uids):
+        self.cel_zones = np.asarray(cel_zones, dtype=np.int64)
+        self.zones = zones.reset_index(drop=True)
+        self.cel_uids = pd.Index(cel_uids)
+
+    @property
+    def num_zones(self) -> int:
+        return len(self.zones)
+
+    @classmethod
+    def from_cells(cls, cellsites: pd.DataFrame, cells: np.ndarray, centers) -> "ZoneIndex":
+        uniq_cells, cel_zones = np.unique(cells, axis=0, return_inverse=True)
+        center_lng, center_lat = centers(uniq_cells)
+        zones = pd.DataFrame(dict(
+            zone=[f"{i}_{j}" for i, j in uniq_cells.tolist()],
+            center_lng=center_lng, center_lat=center_lat
+        ))
+        return cls(cel_zones.ravel(), zones, cellsites.cel_uid)
+
+    @classmethod
+    def from_grid(cls, cellsites: pd.DataFrame, cell_size: float = 500, ref_lat: float = None) -> "ZoneIndex":
+        """Zone cellsites by a square grid of `cell_size` meters."""
+        lng, lat = get_cellsite_lnglat(cellsites)
+        ref_lat = float(np.mean(lat)) if ref_lat is None else ref_lat
+        cells = assign_grid_cells(lng, lat, cell_size, ref_lat)
+        return cls.from_cells(cellsites, cells, lambda c: get_grid_centers(c, cell_size, ref_lat))
+
+    @classmethod
+    def from_hex(cls, cellsites: pd.DataFrame, size: float = 500, ref_lat: float = None) -> "ZoneIndex":
+        """Zone cellsites by a hexagonal grid, `size` is the center to corner distance in meters."""
+        lng, lat = get_cellsite_lnglat(cellsites)
+        ref_lat = float(np.mean(lat)) if ref_lat is None else ref_lat
+        cells = assign_hex_cells(lng, lat, size, ref_lat)
+        return cls.from_cells(cellsites, cells, lambda c: get_hex_centers(c, size, ref_lat))
+
+    @classmethod
+    def from_polygons(cls, cellsites: pd.DataFrame, boundaries, name_col: str = "NAME_3") -> "ZoneIndex":
+        """Zone cellsites by polygons, e.g. the GADM boundaries from `make_boundaries`
+        where `NAME_3` holds the barangays (at `ad_level=3`).
+        """
+        lng, lat = get_cellsite_lnglat(cellsites)
+        cel_zones = assign_polygons(lng, lat, list(boundaries.geometry))
+        centroids = boundaries.geometry.representative_point()
+        zones = pd.DataFrame(dict(
+            zone=boundaries[name_col].to_numpy(),
+            center_lng=centroids.x.to_numpy(), center_lat=centroids.y.to_numpy()
+        ))
+        return cls(cel_zones, zones, cellsites.cel_uid)
+
+    def get_zones(self, cel_codes) -> np.ndarray:
+        """Gather the zone of each cellsite code, -1 for unknown codes."""
+        cel_codes = np.asarray(cel_codes)
+        return np.where(cel_codes >= 0, self.cel_zones[np.clip(cel_codes, 0, None)], -1)
+
+    def encode(self, cel_uids) -> np.ndarray:
+        """Map cellsite ids to the zone of each, -1 for unknown ids or ids outside every zone."""
+        return self.get_zones(self.cel_uids.get_indexer(np.asarray(cel_uids)))
+
+    def count(self, zones, weights=None) -> np.ndarray:
+        """Count (or sum `weights`) per zone, zone -1 is left out."""
+        zones = np.asarray(zones)
+        inside = zones >= 0
+        weights = None if weights is None else np.asarray(weights)[inside]
+        return np.bincount(zones[inside], weights=weights, minlength=self.num_zones)
+
+    def aggregate(self, transactions: pd.DataFrame, values: list = None) -> pd.DataFrame:
+        """Count transactions (and unique subscribers) per zone, plus the sums and means of
+        the `values` columns, one row per zone.
+        """
+        zones = self.encode(transactions.cel_uid)
+        result = self.zones.copy()
+        result["num_transactions"] = self.count(zones).astype(np.int64)
+        inside = zones >= 0
+        sub_codes, sub_uids = pd.factorize(transactions.sub_uid.to_numpy()[inside])
+        # unique (zone, sub) pairs, then a count per zone
+        pairs = np.unique(zones[inside] * len(sub_uids) + sub_codes)
+        result["num_subs"] = self.count(pairs // max(len(sub_uids), 1)).astype(np.int64)
+        for col in values or []:
+            sums = self.count(zones, transactions[col].to_numpy(dtype=np.float64))
+            result[f"sum_{col}"] = sums
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[f"mean_{col}"] = sums / result.num_transactions.to_numpy()
+        return result
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path,
+            cel_zones=self.cel_zones,
+            cel_uids=self.cel_uids.to_numpy().astype(str),
+            zone=self.zones.zone.to_numpy().astype(str),
+            center_lng=self.zones.center_lng.to_numpy(),
+            center_lat=self.zones.center_lat.to_numpy()
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ZoneIndex":
+        with np.load(path, allow_pickle=False) as state:
+            zones = pd.DataFrame(dict(
+                zone=state["zone"].astype(object),
+                center_lng=state["center_lng"], center_lat=state["center_lat"]
+            ))
+            return cls(state["cel_zones"], zones, state["cel_uids"].astype(object))
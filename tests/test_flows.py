@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from sds4gdsp.flows import ODFlows
+
+def make_data(num_subs: int, num_cels: int, num_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    lng, lat = rng.uniform(121.0, 121.1, num_cels), rng.uniform(14.45, 14.55, num_cels)
+    cellsites = pd.DataFrame(dict(cel_uid=[f"glo-cel-{i:03d}" for i in range(num_cels)], lng=lng, lat=lat))
+    transactions = pd.DataFrame(dict(
+        sub_uid=[f"glo-sub-{i:03d}" for i in rng.integers(num_subs, size=num_rows)],
+        cel_uid=cellsites.cel_uid.to_numpy()[rng.integers(num_cels, size=num_rows)],
+        transaction_dt=rng.choice(["2023-06-01", "2023-06-02", "2023-07-01"], size=num_rows),
+        transaction_hr=rng.integers(24, size=num_rows)
+    ))
+    return transactions, cellsites
+
+def test_merged_chunks_match_a_single_pass():
+    transactions, cellsites = make_data(num_subs=80, num_cels=20, num_rows=2_000, seed=2023)
+    expected = ODFlows(len(cellsites), include_stays=True)
+    expected.update(transactions, cellsites)
+    expected.consolidate()
+    # chunks hold complete subscriber trajectories
+    is_first = transactions.sub_uid < "glo-sub-040"
+    flows = ODFlows(len(cellsites), include_stays=True)
+    flows.update(transactions[is_first], cellsites)
+    other = ODFlows(len(cellsites), include_stays=True)
+    other.update(transactions[~is_first], cellsites)
+    flows.merge(other)
+    # every transaction but the first of each (sub, month) starts a hop
+    num_groups = transactions.groupby(["sub_uid", transactions.transaction_dt.str[:7]]).ngroups
+    for kind in ("hour", "date"):
+        keys, counts, distances = flows.layers[kind]
+        expected_keys, expected_counts, expected_distances = expected.layers[kind]
+        assert (keys == expected_keys).all()
+        assert (counts == expected_counts).all()
+        np.testing.assert_allclose(distances, expected_distances)
+        assert counts.sum() == len(transactions) - num_groups
+    assert flows.get_total()[0].sum() == len(transactions) - num_groups
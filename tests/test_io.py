@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from sds4gdsp.io import write_transactions, read_transactions
+
+def make_chunk(num_subs: int, num_rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(dict(
+        txn_uid=[f"glo-txn-{seed}-{i}" for i in range(num_rows)],
+        sub_uid=[f"glo-sub-{i:04d}" for i in rng.integers(num_subs, size=num_rows)],
+        cel_uid=[f"glo-cel-{i:03d}" for i in rng.integers(50, size=num_rows)],
+        transaction_dt=rng.choice(["2023-06-01", "2023-06-02"], size=num_rows),
+        transaction_hr=rng.integers(24, size=num_rows)
+    ))
+
+def test_write_transactions_parts_of_different_widths(tmp_path):
+    # about 80 subs fit an int8 dictionary index, 220 do not
+    chunks = [make_chunk(80, 500, seed=0), make_chunk(220, 2000, seed=1)]
+    for part, chunk in enumerate(chunks):
+        write_transactions(chunk, str(tmp_path), part=part)
+    result = read_transactions(str(tmp_path))
+    expected = pd.concat(chunks, ignore_index=True)
+    key = ["txn_uid"]
+    result = result.astype(dict(sub_uid=str, cel_uid=str)).sort_values(by=key).reset_index(drop=True)
+    expected = expected.sort_values(by=key).reset_index(drop=True)
+    assert len(result) == len(expected)
+    assert (result.sub_uid.to_numpy() == expected.sub_uid.to_numpy()).all()
+    assert (result.cel_uid.to_numpy() == expected.cel_uid.to_numpy()).all()
+    assert (result.transaction_dt.to_numpy() == expected.transaction_dt.to_numpy()).all()
+    assert (result.transaction_hr.to_numpy() == expected.transaction_hr.to_numpy()).all()
+
+def test_read_transactions_filters_subscribers(tmp_path):
+    write_transactions(make_chunk(80, 500, seed=0), str(tmp_path), part=0)
+    write_transactions(make_chunk(220, 2000, seed=1), str(tmp_path), part=1)
+    result = read_transactions(str(tmp_path), sub_uids=["glo-sub-0183"])
+    assert len(result) > 0
+    assert set(result.sub_uid.astype(str)) == {"glo-sub-0183"}
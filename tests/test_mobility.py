@@ -0,0 +1,40 @@
+import numpy as np
+from scipy import sparse
+from sds4gdsp.mobility import calc_group_network_travel_distances
+from sds4gdsp.network import NetworkDistanceTable
+from sds4gdsp.processor import calc_haversine_distances
+
+# three cellsites, each snapped to its own node
+LNG = np.array([121.03, 121.05, 121.08])
+LAT = np.array([14.47, 14.50, 14.55])
+
+def make_table(distances) -> NetworkDistanceTable:
+    nodes = np.arange(len(LNG))
+    return NetworkDistanceTable(distances, nodes, nodes, LNG, LAT)
+
+def test_network_travel_distances_fall_back_to_haversine():
+    # site 2 is unreachable from site 0
+    distances = np.array([
+        [0, 5_000, np.inf],
+        [5_000, 0, 7_000],
+        [9_000, 7_000, 0]
+    ], dtype=np.float32)
+    cel_codes = np.array([0, 1, 2, 0, 2])
+    offsets = np.array([0, 3, 5])
+    result = calc_group_network_travel_distances(offsets, cel_codes, make_table(distances), LNG[cel_codes], LAT[cel_codes])
+    fallback = calc_haversine_distances(LNG[0], LAT[0], LNG[2], LAT[2])
+    assert np.isfinite(result).all()
+    np.testing.assert_allclose(result, [12_000, fallback])
+
+def test_network_travel_distances_outside_top_k():
+    # a sparse table that only kept the 0 <-> 1 pair
+    distances = sparse.csr_matrix(
+        (np.array([5_000, 5_000], dtype=np.float32), ([0, 1], [1, 0])), shape=(3, 3)
+    )
+    table = make_table(distances)
+    assert np.isinf(table.lookup([1], [2])).all()
+    cel_codes = np.array([0, 1, 2])
+    offsets = np.array([0, 3])
+    result = calc_group_network_travel_distances(offsets, cel_codes, table, LNG[cel_codes], LAT[cel_codes])
+    fallback = calc_haversine_distances(LNG[1], LAT[1], LNG[2], LAT[2])
+    np.testing.assert_allclose(result, [5_000 + fallback])
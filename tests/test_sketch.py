@@ -0,0 +1,26 @@
+import numpy as np
+from sds4gdsp.sketch import QuantileSketch
+
+def test_merges_match_a_single_sketch_once_folded():
+    rng = np.random.default_rng(2023)
+    # spread wide enough that 40 buckets fold in every chunk
+    chunks = [rng.lognormal(rng.uniform(0, 10), 2, size=300) for _ in range(6)]
+    expected = QuantileSketch(max_buckets=40).update(np.concatenate(chunks))
+    for _ in range(5):
+        sketches = [QuantileSketch(max_buckets=40).update(chunks[i]) for i in rng.permutation(len(chunks))]
+        # pairwise, like results coming back from workers
+        while len(sketches) > 1:
+            sketches = [
+                sketches[i].merge(sketches[i+1]) if i + 1 < len(sketches) else sketches[i]
+                for i in range(0, len(sketches), 2)
+            ]
+        assert len(sketches[0].counts) == 40
+        assert sketches[0].min_key == expected.min_key
+        assert (sketches[0].counts == expected.counts).all()
+
+def test_quantiles_within_relative_error():
+    values = np.random.default_rng(2023).lognormal(8, 1, size=100_000)
+    sketch = QuantileSketch(alpha=0.01).update(values)
+    qs = np.linspace(0, 1, 21)
+    exact = np.quantile(values, qs, method="lower")
+    np.testing.assert_allclose(sketch.get_quantiles(qs), exact, rtol=0.01)
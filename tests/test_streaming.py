@@ -0,0 +1,41 @@
+import os
+import numpy as np
+import pandas as pd
+from sds4gdsp.mobility import calc_mobility_indices
+from sds4gdsp.streaming import iter_partitions, iter_sub_trajs
+
+def make_data(num_subs: int, num_cels: int, num_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    lng, lat = rng.uniform(121.0, 121.1, num_cels), rng.uniform(14.45, 14.55, num_cels)
+    cellsites = pd.DataFrame(dict(
+        cel_uid=[f"glo-cel-{i:03d}" for i in range(num_cels)],
+        coords=[f"POINT ({x} {y})" for x, y in zip(lng, lat)]
+    ))
+    transactions = pd.DataFrame(dict(
+        txn_uid=[f"glo-txn-{i:05d}" for i in range(num_rows)],
+        sub_uid=[f"glo-sub-{i:03d}" for i in rng.integers(num_subs, size=num_rows)],
+        cel_uid=cellsites.cel_uid.to_numpy()[rng.integers(num_cels, size=num_rows)],
+        transaction_dt=rng.choice(["2023-06-01", "2023-06-02", "2023-06-03"], size=num_rows),
+        transaction_hr=rng.integers(24, size=num_rows)
+    ))
+    return transactions, cellsites
+
+def test_partitions_hold_complete_trajectories(tmp_path):
+    transactions, cellsites = make_data(num_subs=120, num_cels=30, num_rows=3_000, seed=2023)
+    filepath = os.path.join(tmp_path, "transactions.csv")
+    transactions.to_csv(filepath, index=False)
+    # a budget of about a quarter of the loaded file, read back in small chunks
+    memory_budget = os.path.getsize(filepath)
+    stores = list(iter_partitions(filepath, cellsites, memory_budget, str(tmp_path), chunksize=500))
+    assert len(stores) > 1
+    sub_uids = [sub for sub, _ in iter_sub_trajs(filepath, cellsites, memory_budget, str(tmp_path), chunksize=500)]
+    assert len(sub_uids) == len(set(sub_uids))
+    assert set(sub_uids) == set(transactions.sub_uid)
+    assert sum(len(store.transactions) for store in stores) == len(transactions)
+    result = pd.concat(
+        [calc_mobility_indices(store.transactions, cellsites) for store in stores], ignore_index=True
+    ).sort_values(by="sub_uid").reset_index(drop=True)
+    expected = calc_mobility_indices(transactions, cellsites).sort_values(by="sub_uid").reset_index(drop=True)
+    assert (result.sub_uid.to_numpy() == expected.sub_uid.to_numpy()).all()
+    for metric in ("total_travel_distance", "radius_of_gyration", "activity_entropy"):
+        np.testing.assert_allclose(result[metric].to_numpy(), expected[metric].to_numpy())
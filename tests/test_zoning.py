@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import pandas as pd
+from sds4gdsp.zoning import ZoneIndex
+
+def make_data(num_subs: int, num_cels: int, num_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    lng, lat = rng.uniform(121.0, 121.1, num_cels), rng.uniform(14.45, 14.55, num_cels)
+    cellsites = pd.DataFrame(dict(cel_uid=[f"glo-cel-{i:03d}" for i in range(num_cels)], lng=lng, lat=lat))
+    # a few transactions on cellsites that are not in the table, so outside every zone
+    cel_uids = np.append(cellsites.cel_uid.to_numpy(), ["glo-cel-998", "glo-cel-999"])
+    transactions = pd.DataFrame(dict(
+        sub_uid=[f"glo-sub-{i:03d}" for i in rng.integers(num_subs, size=num_rows)],
+        cel_uid=cel_uids[rng.integers(len(cel_uids), size=num_rows)],
+        transaction_hr=rng.integers(24, size=num_rows)
+    ))
+    return transactions, cellsites
+
+def test_aggregate_matches_pandas(tmp_path):
+    transactions, cellsites = make_data(num_subs=50, num_cels=60, num_rows=3_000, seed=2023)
+    index = ZoneIndex.from_grid(cellsites, cell_size=2_000)
+    result = index.aggregate(transactions, values=["transaction_hr"])
+    zones = index.encode(transactions.cel_uid)
+    inside = transactions.cel_uid.isin(cellsites.cel_uid).to_numpy()
+    assert ((zones >= 0) == inside).all()
+    assert result.num_transactions.sum() == inside.sum()
+    expected = transactions[inside].groupby(zones[inside]).agg(
+        num_subs=("sub_uid", "nunique"), sum_transaction_hr=("transaction_hr", "sum")
+    ).reindex(range(index.num_zones), fill_value=0)
+    assert (result.num_subs.to_numpy() == expected.num_subs.to_numpy()).all()
+    np.testing.assert_allclose(result.sum_transaction_hr.to_numpy(), expected.sum_transaction_hr.to_numpy())
+    path = os.path.join(tmp_path, "zones.npz")
+    index.save(path)
+    loaded = ZoneIndex.load(path)
+    assert (loaded.cel_zones == index.cel_zones).all()
+    assert (loaded.zones.zone.to_numpy() == index.zones.zone.to_numpy()).all()
+    assert (loaded.encode(transactions.cel_uid) == zones).all()